@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+'''
+Replay of the TransactionID duplicate check of the importer against a large
+RawImport table. It compares the old check of one query per line, without an
+index, to the set based check that the importer uses now: an index on
+TransactionID and one temp table join per chunk of lines, the same SQL as
+Database.get_existing_values().
+
+    python3 bench/bench_dedup.py [rows] [chunk size]
+
+The database is a scratch file in the temp directory.
+'''
+
+import os, sys, time, tempfile
+import sqlite3 as sql
+
+def main(rows=500000, chunk=500, sample=200):
+
+    fname = os.path.join(tempfile.gettempdir(), 'bench_dedup.db')
+    if os.path.exists(fname):
+        os.remove(fname)
+
+    db = sql.connect(fname)
+    db.execute('CREATE TABLE RawImport (ID INTEGER PRIMARY KEY, TransactionID TEXT);')
+    db.executemany('INSERT INTO RawImport (TransactionID) VALUES (?);', (('T%08d'%(x),) for x in range(rows)))
+    db.commit()
+    ids = ['T%08d'%(x) for x in range(rows)]
+
+    start = time.perf_counter()
+    for tid in ids[:sample]:
+        db.execute('SELECT TransactionID FROM RawImport WHERE TransactionID = ?;', (tid,)).fetchone()
+    per_line = (time.perf_counter() - start) / sample
+    print('per line check, no index: %0.2f ms/line, %0.0f s for %d lines'%(per_line * 1000, per_line * rows, rows))
+
+    start = time.perf_counter()
+    db.execute('CREATE INDEX RawImportTransactionID ON RawImport (TransactionID);')
+    db.commit()
+    print('index build: %0.2f s'%(time.perf_counter() - start))
+
+    start = time.perf_counter()
+    known = 0
+    for idx in range(0, rows, chunk):
+        db.execute('CREATE TEMP TABLE IncomingValues (value);')
+        db.executemany('INSERT INTO temp.IncomingValues (value) VALUES (?);', ((x,) for x in ids[idx:idx+chunk]))
+        known += len(db.execute('SELECT DISTINCT i.value FROM temp.IncomingValues AS i '
+                        'JOIN RawImport AS t ON t.TransactionID = i.value;').fetchall())
+        db.execute('DROP TABLE temp.IncomingValues;')
+    print('set based check in chunks of %d: %0.2f s, %d known'%(chunk, time.perf_counter() - start, known))
+
+    db.close()
+    os.remove(fname)
+
+if __name__ == '__main__':
+    main(*[int(x) for x in sys.argv[1:3]])
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+'''
+Import and form throughput of the connection tuning profiles in
+Database.profiles, compared to the SQLite defaults (DELETE journal,
+synchronous FULL). For each profile a new database is made and:
+
+    import      ImportPayPal.import_stream() of a generated PayPal CSV, with the
+                profile in place of bulk-import
+    form load   get_row_with_joins() of every sale, as Form.load_form() does
+    form save   one save_form() style UPDATE and commit for each of some sales
+
+The best of a few runs is kept. read-only-report is query_only, so it only has
+the form load. The import is one transaction, so synchronous only matters at its
+commit and most of its time is spent in Python. The saves commit each time, so
+they show the journal mode and synchronous.
+
+    python3 bench/bench_profiles.py [csv lines] [runs]
+
+The databases are made in a scratch directory in the temp directory.
+'''
+
+import os, sys, csv, time, random, shutil, tempfile
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from logger import *
+from database import Database
+from importer import ImportPayPal
+
+default = {'journal_mode':'DELETE',
+           'synchronous':'FULL',
+           'cache_size':-2000,
+           'mmap_size':0,
+           'temp_store':'DEFAULT',
+           'busy_timeout':0,
+           'query_only':'OFF'}
+
+joins = (('customer', 'customer_ID', 'Customer', 'name'),
+         ('status', 'status_ID', 'SaleStatus', 'name'))
+
+def make_csv(fname, lines):
+    '''
+    Write a PayPal CSV with lines transactions in January 2020.
+    '''
+    r = random.Random(1)
+    legend = ImportPayPal(fname).legend
+    with open(fname, 'w', newline='') as fh:
+        out = csv.writer(fh)
+        out.writerow(legend)
+        for idx in range(lines):
+            row = dict([(x, '') for x in legend])
+            row.update({'Date':'1/%d/2020'%(idx % 28 + 1),
+                        'Time':'10:00:00',
+                        'Name':'Person %d'%(r.randint(0, lines // 5)),
+                        'Type':'Website Payment',
+                        'Gross':'%0.2f'%(r.random() * 100),
+                        'Fee':'1.00',
+                        'Shipping':'2.00',
+                        'SalesTax':'0.50',
+                        'TransactionID':'T%08d'%(idx),
+                        'Country':'United States',
+                        'CountryCode':'US',
+                        'Subject':'subject %d'%(idx),
+                        'ItemTitle':'item %d'%(idx),
+                        'BalanceImpact':'Credit' if r.random() < 0.6 else 'Debit'})
+            out.writerow([row[x] for x in legend])
+
+def new_database(data):
+    '''
+    Close the database, remove it and open a new one.
+    '''
+    data.close()
+    for ext in ('', '-wal', '-shm', '.bak'):
+        if os.path.exists(data.database_name + ext):
+            os.remove(data.database_name + ext)
+    data.lookups = {}
+    data.open()
+
+def run(data, name, fname, lines, saves):
+    '''
+    Return (import lines/s, form load records/s, form save records/s) for one
+    profile. A rate is None when the profile can not write.
+    '''
+    new_database(data)
+    writes = data.profiles[name]['query_only'] == 'OFF'
+    bulk = data.profiles['bulk-import']
+    if writes:
+        data.profiles['bulk-import'] = data.profiles[name]
+    try:
+        start = time.perf_counter()
+        ImportPayPal(fname).import_stream()
+        imported = lines / (time.perf_counter() - start)
+    finally:
+        data.profiles['bulk-import'] = bulk
+
+    data.push_profile(name)
+    ids = data.get_id_list('SaleRecord')
+    start = time.perf_counter()
+    for ID in ids:
+        data.get_row_with_joins('SaleRecord', ID, joins)
+    loaded = len(ids) / (time.perf_counter() - start)
+
+    saved = None
+    if writes:
+        start = time.perf_counter()
+        for ID in ids[:saves]:
+            with data.transaction('save_form'):
+                data.update_row_by_id('SaleRecord', {'notes':'edited', 'status_ID':1}, ID)
+        saved = saves / (time.perf_counter() - start)
+    data.pop_profile()
+
+    return (imported if writes else None, loaded, saved)
+
+def rate(value):
+    if value is None:
+        return '%8s'%('n/a')
+    return '%8.0f'%(value)
+
+def main(lines=20000, runs=3, saves=300):
+
+    here = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+    work = tempfile.mkdtemp(prefix='bench_profiles')
+    os.mkdir(os.path.join(work, 'sql'))
+    for name in ('database.sql', 'populate.sql'):
+        shutil.copy(os.path.join(here, 'sql', name), os.path.join(work, 'sql'))
+    shutil.copytree(os.path.join(here, 'sql', 'migrations'), os.path.join(work, 'sql', 'migrations'))
+    os.chdir(work)
+
+    # The log messages of the imports are not part of the report.
+    stream = LogStream.get_instance()
+    for sink in list(stream.sinks):
+        if isinstance(sink, StderrSink):
+            stream.remove_sink(sink)
+
+    fname = os.path.join(work, 'bench.csv')
+    make_csv(fname, lines)
+    data = Database.get_instance()
+    data.profiles['sqlite default'] = default
+
+    print('%-20s %8s %8s %8s'%('profile', 'import', 'load', 'save'))
+    print('%-20s %8s %8s %8s'%('', 'lines/s', 'rec/s', 'rec/s'))
+    for name in ['sqlite default'] + [x for x in data.profiles if x != 'sqlite default']:
+        results = [run(data, name, fname, lines, saves) for x in range(runs)]
+        best = [max([x[idx] for x in results]) if not results[0][idx] is None else None for idx in range(3)]
+        print('%-20s %s %s %s'%(name, rate(best[0]), rate(best[1]), rate(best[2])))
+
+    data.close()
+    os.chdir(here)
+    shutil.rmtree(work)
+
+if __name__ == '__main__':
+    main(*[int(x) for x in sys.argv[1:3]])
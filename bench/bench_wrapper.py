@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+'''
+Per call cost of func_wrapper on a method of a decorated class, compared to an
+undecorated method, with tracing off, with tracing on and the logger above
+DEBUG, and with profiling on. It also checks that a bound method taken before
+the switch, like a Tk callback, follows both switches.
+
+    python3 bench/bench_wrapper.py [calls]
+'''
+
+import os, sys, time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import logger
+from logger import *
+
+@class_wrapper
+class Target(object):
+
+    log_level = Logger.INFO
+
+    @func_wrapper
+    def wrapped(self, x):
+        return x
+
+    def plain(self, x):
+        return x
+
+def per_call(func, arg, count):
+    start = time.perf_counter()
+    for idx in range(count):
+        func(arg)
+    return (time.perf_counter() - start) / count * 1e6
+
+def report(name, value):
+    print('%-28s %6.2f us/call'%(name + ':', value))
+
+def main(count=200000):
+
+    obj = Target()
+    callback = obj.wrapped      # bound before any switch, like a Tk command
+    big = list(range(2000))
+
+    report('undecorated', per_call(obj.plain, 1, count))
+    report('off', per_call(callback, 1, count))
+    report('off, 2000 item list arg', per_call(callback, big, count))
+
+    set_tracing(True)
+    report('tracing on, INFO level', per_call(callback, 1, count))
+
+    sink = MemorySink()
+    obj.logger.stream.add_sink(sink)
+    obj.logger.set_level(Logger.DEBUG)
+    for idx in range(10):
+        callback(idx)
+    obj.logger.stream.flush()
+    obj.logger.set_level(Logger.INFO)
+    obj.logger.stream.remove_sink(sink)
+    set_tracing(False)
+    traced = len([x for x in sink.get_lines() if 'wrapped()' in x and '--enter' in x])
+    print('calls traced through the old bound method: %d of 10'%(traced))
+
+    clear_profile()
+    set_profiling(True)
+    report('profiling on', per_call(callback, 1, count))
+    set_profiling(False)
+
+    calls = dict([(x['method'], x['calls']) for x in get_profile()])
+    print('calls profiled through the old bound method: %d of %d'%(calls.get('Target.wrapped', 0), count))
+
+if __name__ == '__main__':
+    main(*[int(x) for x in sys.argv[1:2]])
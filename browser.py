@@ -0,0 +1,297 @@
+'''
+This module implements the record browsers for customers, vendors, sales and
+purchases. A browser is a ttk.Treeview that only holds a window of rows. More
+rows are read from the database as the user scrolls and the rows that scroll far
+out of view are dropped, so it does not matter how big the table is.
+'''
+
+import tkinter as tk
+import tkinter.ttk as ttk
+from database import Database
+from logger import *
+
+@class_wrapper
+class Browser(tk.Frame):
+    '''
+    Treeview that pages through the rows of a table. Clicking a heading that can be
+    sorted sorts by that column, and clicking it again reverses the order. Text in
+    the filter entry selects the rows where the filter column starts with it. A
+    double click or the Enter key calls open_cb with the ID of the row.
+    '''
+
+    # For each table: the columns as (column, heading, width), the columns that
+    # can be sorted, the filter column and the joins used to show names instead
+    # of IDs. The sort and filter columns are indexed. Sales and purchases use
+    # iso_date, the YYYY-MM-DD form of the PayPal date. (see migration 8)
+    layouts = {
+        'Customer': {
+            'columns': (('name', 'Name', 200), ('email_address', 'Email', 220),
+                        ('city', 'City', 120), ('state', 'State', 80)),
+            'sort': ('name', 'ID'),
+            'filter': 'name',
+            'joins': ()},
+        'Vendor': {
+            'columns': (('name', 'Name', 200), ('contact_name', 'Contact', 150),
+                        ('email_address', 'Email', 220)),
+            'sort': ('name', 'ID'),
+            'filter': 'name',
+            'joins': ()},
+        'SaleRecord': {
+            'columns': (('iso_date', 'Date', 150), ('customer', 'Customer', 200),
+                        ('gross', 'Gross', 80), ('fees', 'Fees', 80), ('shipping', 'Shipping', 80)),
+            'sort': ('iso_date', 'ID'),
+            'filter': 'iso_date',
+            'joins': (('customer', 'customer_ID', 'Customer', 'name'),)},
+        'PurchaseRecord': {
+            'columns': (('iso_date', 'Date', 150), ('vendor', 'Vendor', 200),
+                        ('gross', 'Gross', 80), ('tax', 'Tax', 80), ('shipping', 'Shipping', 80)),
+            'sort': ('iso_date', 'ID'),
+            'filter': 'iso_date',
+            'joins': (('vendor', 'vendor_ID', 'Vendor', 'name'),)},
+    }
+
+    page_size = 100     # rows read at a time
+    max_rows = 400      # rows kept in the tree
+    margin = 0.1        # fraction of the tree from the end that triggers a read
+    filter_ms = 300     # delay after a key stroke before the filter is applied
+
+    def __init__(self, owner, table, open_cb=None, height=20, **kw):
+        '''
+        owner   =   The frame to place the browser in.
+        table   =   One of the tables in layouts.
+        open_cb =   Called with the ID of a row when it is opened.
+        height  =   Number of rows that are visible.
+        '''
+        super().__init__(owner, **kw)
+
+        if not table in self.layouts:
+            raise Exception("There is no browser layout for table %s"%(table))
+
+        self.data = Database.get_instance()
+        self.table = table
+        self.layout = self.layouts[table]
+        self.open_cb = open_cb
+        self.cols = tuple([x[0] for x in self.layout['columns']])
+
+        self.order = self.layout['sort'][0]
+        self.reverse = False
+        self.prefix = ''
+        self.keys = {}          # (sort_key, ID) of each row in the tree
+        self.at_start = True    # the first row of the table is in the tree
+        self.at_end = True      # the last row of the table is in the tree
+        self.loading = False
+        self.filter_job = None
+
+        bar = tk.Frame(self)
+        heading = dict([(x[0], x[1]) for x in self.layout['columns']])[self.layout['filter']]
+        tk.Label(bar, text='Filter %s:'%(heading)).pack(side=tk.LEFT)
+        self.filter_var = tk.StringVar(self)
+        self.filter_var.trace_add('write', self._filter_changed)
+        tk.Entry(bar, textvariable=self.filter_var, width=30).pack(side=tk.LEFT, padx=5)
+        bar.grid(row=0, column=0, sticky='w', pady=5)
+
+        self.tree = ttk.Treeview(self, columns=self.cols, show='headings', height=height, selectmode='browse')
+        for name, text, width in self.layout['columns']:
+            if name in self.layout['sort']:
+                self.tree.heading(name, text=text, command=lambda c=name: self.sort_by(c))
+            else:
+                self.tree.heading(name, text=text)
+            self.tree.column(name, width=width)
+        self.tree.grid(row=1, column=0, sticky='nsew')
+
+        self.vsb = tk.Scrollbar(self, orient='vertical', command=self.tree.yview)
+        self.vsb.grid(row=1, column=1, sticky='ns')
+        self.tree.configure(yscrollcommand=self._on_scroll)
+
+        self.tree.bind('<Double-1>', self._open)
+        self.tree.bind('<Return>', self._open)
+
+        self.reload()
+
+    @func_wrapper
+    def reload(self):
+        '''
+        Throw away the rows and read the first page for the current order and filter.
+        '''
+        self.tree.delete(*self.tree.get_children())
+        self.keys = {}
+        rows = self._read(None, self.reverse)
+        self._insert(rows, tk.END)
+        self.at_start = True
+        self.at_end = len(rows) < self.page_size
+        self.tree.yview_moveto(0)
+
+    @func_wrapper
+    def sort_by(self, col):
+        '''
+        Sort by the column. Sorting by the current column reverses the order.
+        '''
+        if col == self.order:
+            self.reverse = not self.reverse
+        else:
+            self.order = col
+            self.reverse = False
+        self.reload()
+
+    @func_wrapper
+    def get_selected(self):
+        '''
+        Return the ID of the selected row, or None.
+        '''
+        sel = self.tree.selection()
+        if len(sel) == 0:
+            return None
+        return self.keys[sel[0]][1]
+
+    @func_wrapper
+    def _read(self, after, reverse):
+        '''
+        Read one page that starts after the key, in the given direction.
+        '''
+        return self.data.get_page(self.table, self.cols, self.order, reverse, after,
+                        self.prefix, self.layout['filter'], self.layout['joins'], self.page_size)
+
+    @func_wrapper
+    def _insert(self, rows, where):
+        '''
+        Put the rows into the tree. With where set to 0 each row goes above the one
+        before it, which is the order that a reversed page is read in.
+        '''
+        for row in rows:
+            iid = str(row['ID'])
+            values = ['' if row[x] is None else row[x] for x in self.cols]
+            self.tree.insert('', where, iid=iid, values=values)
+            self.keys[iid] = (row['sort_key'], row['ID'])
+
+    @func_wrapper
+    def _on_scroll(self, lo, hi):
+        '''
+        The yscrollcommand of the tree. Move the scroll bar and read more rows when
+        the view gets close to either end of the rows that are in the tree.
+        '''
+        self.vsb.set(lo, hi)
+        if self.loading:
+            return
+
+        if float(hi) > 1.0 - self.margin and not self.at_end:
+            self.loading = True
+            self.after_idle(self._read_next)
+        elif float(lo) < self.margin and not self.at_start:
+            self.loading = True
+            self.after_idle(self._read_prev)
+
+    @func_wrapper
+    def _read_next(self):
+        '''
+        Add the next page at the bottom and drop rows from the top.
+        '''
+        items = self.tree.get_children()
+        first = self._first_visible(items)
+        rows = self._read(self.keys[items[-1]], self.reverse)
+        self._insert(rows, tk.END)
+        self.at_end = len(rows) < self.page_size
+
+        dropped = self._trim(self.tree.get_children(), True)
+        if dropped > 0:
+            self.at_start = False
+            self._move_to(first - dropped)
+        self.loading = False
+
+    @func_wrapper
+    def _read_prev(self):
+        '''
+        Add the previous page at the top and drop rows from the bottom.
+        '''
+        items = self.tree.get_children()
+        first = self._first_visible(items)
+        rows = self._read(self.keys[items[0]], not self.reverse)
+        self._insert(rows, 0)
+        self.at_start = len(rows) < self.page_size
+
+        if self._trim(self.tree.get_children(), False) > 0:
+            self.at_end = False
+        self._move_to(first + len(rows))
+        self.loading = False
+
+    @func_wrapper
+    def _trim(self, items, top):
+        '''
+        Drop the rows over max_rows from the top or the bottom. Return the number
+        of rows that were dropped.
+        '''
+        extra = len(items) - self.max_rows
+        if extra <= 0:
+            return 0
+
+        if top:
+            drop = items[:extra]
+        else:
+            drop = items[-extra:]
+        self.tree.delete(*drop)
+        for iid in drop:
+            del self.keys[iid]
+        return extra
+
+    @func_wrapper
+    def _first_visible(self, items):
+        '''
+        Return the index of the first row that is in view.
+        '''
+        return int(round(self.tree.yview()[0] * len(items)))
+
+    @func_wrapper
+    def _move_to(self, index):
+        '''
+        Scroll so that the row at the index is the first one in view.
+        '''
+        count = len(self.tree.get_children())
+        if count > 0:
+            self.tree.yview_moveto(max(index, 0) / count)
+
+    @func_wrapper
+    def _filter_changed(self, *args):
+        '''
+        Apply the filter a little while after the last key stroke.
+        '''
+        if not self.filter_job is None:
+            self.after_cancel(self.filter_job)
+        self.filter_job = self.after(self.filter_ms, self._apply_filter)
+
+    @func_wrapper
+    def _apply_filter(self):
+        self.filter_job = None
+        self.prefix = self.filter_var.get()
+        self.reload()
+
+    @func_wrapper
+    def _open(self, event=None):
+        row_id = self.get_selected()
+        if not row_id is None and not self.open_cb is None:
+            self.open_cb(row_id)
+
+
+@class_wrapper
+class BrowseDialog(tk.Toplevel):
+    '''
+    Window with a Browser in it. Opening a row calls open_cb with its ID, so the
+    record can be shown in the form that the browser was opened from.
+    '''
+
+    def __init__(self, owner, table, open_cb=None):
+
+        super().__init__(owner)
+        self.title('Browse %s'%(table))
+        self.open_cb = open_cb
+
+        self.browser = Browser(self, table, self._open)
+        self.browser.grid(row=0, column=0, padx=5, pady=5)
+
+        box = tk.Frame(self)
+        tk.Button(box, text='Open', width=10, command=self.browser._open).pack(side=tk.LEFT, padx=5, pady=5)
+        tk.Button(box, text='Close', width=10, command=self.destroy).pack(side=tk.LEFT, padx=5, pady=5)
+        box.grid(row=1, column=0)
+
+    @func_wrapper
+    def _open(self, row_id):
+        if not self.open_cb is None:
+            self.open_cb(row_id)
@@ -0,0 +1,254 @@
+'''
+This module implements the dashboard on the Home tab. It shows the balance sheet,
+the P&L of the last months and the sales and purchases that are not committed yet.
+The figures are read by a background thread with its own database connection, so
+the GUI never waits on them. They are cached by the version of the ledger change
+counter and only the months that changed are read again. (see migration 6) The
+totals of the uncommitted sales and purchases are read every time.
+'''
+
+import locale
+import queue, threading
+import tkinter as tk
+import tkinter.ttk as ttk
+from database import Database
+from logger import *
+
+@class_wrapper
+class LedgerReport(object):
+    '''
+    Reads the figures of the dashboard from the ledger rollups. Everything in here
+    runs in the background thread and uses the connection that it opened there.
+    '''
+
+    months = 12     # number of months in the P&L
+
+    def __init__(self):
+        self.data = Database.get_instance()
+        self.db = None
+        self.version = 0
+        self.periods = {}   # {month: {account ID: amount}}
+        self.figures = None
+
+    @func_wrapper
+    def update(self):
+        '''
+        Bring the figures up to date with the ledger and return them. When the ledger
+        did not change since the last call only the uncommitted totals are read. The
+        forms change sales and purchases without touching the ledger, and the totals
+        are a cheap read of the partial index of migration 4. All of the reads are in
+        one transaction so that they agree.
+        '''
+        if self.db is None:
+            self.db = self.data.open_reader()
+
+        redo = None
+        self.db.execute('BEGIN;')
+        try:
+            uncommitted = {'SaleRecord':self._read_uncommitted('SaleRecord'),
+                           'PurchaseRecord':self._read_uncommitted('PurchaseRecord')}
+            version = self.data.get_ledger_version(self.db)
+            if version != self.version:
+                changes = self.data.get_ledger_changes(self.version, self.db)
+                if '*' in changes:
+                    self.periods = {}
+
+                months = [x[0] for x in self.db.execute('SELECT DISTINCT period FROM AccountMonth '
+                                'ORDER BY period DESC LIMIT ?;', (self.months,))]
+                months.reverse()
+                redo = [x for x in months if x in changes or not x in self.periods]
+                self.periods = dict([(x, self.periods[x]) for x in months if x in self.periods])
+                for month in redo:
+                    self.periods[month] = self._read_month(month)
+
+                self.figures = {'version':version,
+                                'accounts':self._read_accounts(),
+                                'balances':self._read_balances(),
+                                'months':months,
+                                'periods':dict(self.periods),
+                                'closed':self.data.get_last_close(self.db)}
+                self.version = version
+        finally:
+            self.db.rollback()
+
+        if not redo is None:
+            self.logger.info('Report version %d: read %d of %d months'%(version, len(redo), len(months)))
+
+        # A new dict, the GUI thread may still hold the last one.
+        figures = dict(self.figures)
+        figures['uncommitted'] = uncommitted
+        figures['redone'] = [] if redo is None else redo
+        return figures
+
+    @func_wrapper
+    def _read_accounts(self):
+        '''
+        Return a list of (ID, name, section) of the accounts in number order.
+        '''
+        return [tuple(x) for x in self.db.execute('SELECT ID, name, section FROM Account ORDER BY number;')]
+
+    @func_wrapper
+    def _read_balances(self):
+        '''
+        Return a dict of {account ID: balance} from the last month of each account.
+        '''
+        return dict([tuple(x) for x in self.db.execute('SELECT m.account_ID, m.balance FROM AccountMonth AS m '
+                        'WHERE m.period = (SELECT MAX(period) FROM AccountMonth WHERE account_ID = m.account_ID);')])
+
+    @func_wrapper
+    def _read_month(self, month):
+        '''
+        Return a dict of {account ID: amount} of the month.
+        '''
+        return dict([tuple(x) for x in self.db.execute('SELECT account_ID, amount FROM AccountMonth '
+                        'WHERE period = ?;', (month,))])
+
+    @func_wrapper
+    def _read_uncommitted(self, table):
+        '''
+        Return the number and the gross of the records that are not committed. This
+        uses the partial index of migration 4.
+        '''
+        row = self.db.execute('SELECT COUNT(*), IFNULL(SUM(gross), 0) FROM %s '
+                        'WHERE committed = false;'%(table)).fetchone()
+        return (row[0], row[1])
+
+
+@class_wrapper
+class Dashboard(tk.Frame):
+    '''
+    The Home tab. It asks the background thread for the figures when it is shown or
+    refresh() is called, and polls for the answer with after() so that Tk is only
+    used by the GUI thread.
+    '''
+
+    poll_ms = 100   # time between checks for the figures
+
+    def __init__(self, notebook):
+
+        super().__init__(notebook.get_frame(notebook.get_tab_index('Home')))
+        notebook.set_show_cb('Home', self.refresh)
+
+        self.report = LedgerReport()
+        self.requests = queue.Queue()
+        self.results = queue.Queue()
+        self.pending = False
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+        self.status = tk.StringVar(self, 'Reading the ledger...')
+        tk.Label(self, textvariable=self.status).grid(row=0, column=0, columnspan=2, sticky='w')
+
+        tk.Label(self, text='Balance Sheet').grid(row=1, column=0, sticky='w')
+        self.balance_tree = ttk.Treeview(self, columns=('amount',), height=14)
+        self.balance_tree.heading('#0', text='Account')
+        self.balance_tree.heading('amount', text='Balance')
+        self.balance_tree.column('#0', width=200)
+        self.balance_tree.column('amount', width=100, anchor='e')
+        self.balance_tree.grid(row=2, column=0, sticky='nw', padx=5)
+
+        tk.Label(self, text='Profit and Loss').grid(row=1, column=1, sticky='w')
+        self.pl_tree = ttk.Treeview(self, height=14, show='tree headings')
+        self.pl_tree.grid(row=2, column=1, sticky='nw', padx=5)
+
+        self.uncommitted = tk.StringVar(self)
+        tk.Label(self, textvariable=self.uncommitted).grid(row=3, column=0, columnspan=2, sticky='w')
+
+        self.grid()
+        self.refresh()
+
+    @func_wrapper
+    def refresh(self):
+        '''
+        Ask the background thread for the figures. Only one request is out at a time.
+        '''
+        if not self.pending:
+            self.pending = True
+            self.requests.put('update')
+            self.after(self.poll_ms, self._poll)
+
+    def _run(self):
+        '''
+        Body of the background thread.
+        '''
+        while True:
+            self.requests.get()
+            try:
+                result = self.report.update()
+            except Exception as e:
+                result = e
+            self.results.put(result)
+
+    @func_wrapper
+    def _poll(self):
+        try:
+            result = self.results.get_nowait()
+        except queue.Empty:
+            self.after(self.poll_ms, self._poll)
+            return
+
+        self.pending = False
+        if isinstance(result, Exception):
+            self.status.set('The reports could not be read: %s'%(str(result)))
+            self.logger.error('Report failed: %s'%(str(result)))
+        else:
+            self._show(result)
+
+    @func_wrapper
+    def _show(self, figures):
+        '''
+        Fill in the balance sheet, the P&L and the uncommitted totals.
+        '''
+        sections = {}
+        for ID, name, section in figures['accounts']:
+            sections.setdefault(section, []).append((ID, name))
+        balances = figures['balances']
+
+        # Credit balances are negative in the ledger, so they are shown negated.
+        self.balance_tree.delete(*self.balance_tree.get_children())
+        earnings = -sum([balances.get(ID, 0.0) for s in ('income', 'expense') for ID, name in sections.get(s, [])])
+        for section, sign in (('asset', 1), ('liability', -1), ('equity', -1)):
+            rows = [(name, sign * balances.get(ID, 0.0)) for ID, name in sections.get(section, [])]
+            if section == 'equity':
+                rows.append(('Retained earnings', earnings))
+            parent = self.balance_tree.insert('', tk.END, text=section.capitalize(), open=True,
+                            values=(self._money(sum([x[1] for x in rows])),))
+            for name, amount in rows:
+                self.balance_tree.insert(parent, tk.END, text=name, values=(self._money(amount),))
+
+        months = figures['months']
+        periods = figures['periods']
+        self.pl_tree.delete(*self.pl_tree.get_children())
+        self.pl_tree.configure(columns=months)
+        self.pl_tree.heading('#0', text='Account')
+        self.pl_tree.column('#0', width=180)
+        for month in months:
+            self.pl_tree.heading(month, text=month)
+            self.pl_tree.column(month, width=75, anchor='e')
+
+        net = dict([(x, 0.0) for x in months])
+        for section, sign in (('income', -1), ('expense', 1)):
+            totals = dict([(x, 0.0) for x in months])
+            parent = self.pl_tree.insert('', tk.END, text=section.capitalize(), open=True)
+            for ID, name in sections.get(section, []):
+                amounts = [sign * periods[x].get(ID, 0.0) for x in months]
+                for month, amount in zip(months, amounts):
+                    totals[month] += amount
+                self.pl_tree.insert(parent, tk.END, text=name, values=[self._money(x) for x in amounts])
+            self.pl_tree.item(parent, values=[self._money(totals[x]) for x in months])
+            for month in months:
+                net[month] -= sign * totals[month]
+        self.pl_tree.insert('', tk.END, text='Net income', values=[self._money(net[x]) for x in months])
+
+        sales = figures['uncommitted']['SaleRecord']
+        purchases = figures['uncommitted']['PurchaseRecord']
+        self.uncommitted.set('Not committed: %d sales (%s gross), %d purchases (%s gross)'%(
+                        sales[0], self._money(sales[1]), purchases[0], self._money(purchases[1])))
+        if figures['closed'] is None:
+            self.status.set('Ledger version %d'%(figures['version']))
+        else:
+            self.status.set('Ledger version %d, books closed through %s'%(figures['version'], figures['closed']['date']))
+
+    @func_wrapper
+    def _money(self, value):
+        return locale.format_string('%0.2f', value, grouping=True)
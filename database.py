@@ -1,5 +1,7 @@
-import os
+import os, re
 import time, locale
+from collections import OrderedDict
+from contextlib import contextmanager
 
 import sqlite3 as sql
 import tkinter as tk
@@ -13,6 +15,7 @@ class Database(object):
     logic and place it here.
     '''
 
+    log_level = Logger.INFO
     __instance = None
 
     @staticmethod
@@ -33,13 +36,73 @@ class Database(object):
             Database.__instance = self
 
         # Continue with init exactly once.
-        self.data_version = '1.0'
+        self.data_version = 10   # schema version (migration number) this code expects
         self.database_name = 'sql/accounting.db'
         self.db_create_file = 'sql/database.sql'
         self.db_pop_file = 'sql/populate.sql'
+        self.db_migration_dir = 'sql/migrations'
+        self.chunk_size = 500   # rows per executemany() in the bulk methods
+        self.fetch_size = 256   # rows per fetchmany() in the row iterators
+        self.cached_statements = 128    # size of the prepared statement cache
+        self.statements = OrderedDict()
+        self.statement_hits = 0
+        self.statement_misses = 0
+
+        # Small static tables from populate.sql that are cached as value <-> ID maps.
+        self.lookup_tables = ('Country', 'PhoneStatus', 'EmailStatus', 'ContactClass',
+                              'SaleStatus', 'PurchaseStatus', 'PurchaseType',
+                              'VendorType', 'AccountTypes')
+        self.lookups = {}
+        self.lookup_hits = 0
+        self.lookup_misses = 0
+
+        # Ledger rollup tables (see migration 5) and the length of their period.
+        self.rollups = {'AccountDay':10, 'AccountMonth':7}
+
+        # Tables that have a full text index (see migration 3) and its columns.
+        self.search_tables = {'Customer': ('name', 'email_address', 'notes'),
+                              'Vendor': ('name', 'email_address', 'notes'),
+                              'SaleRecord': ('notes',),
+                              'PurchaseRecord': ('notes',),
+                              'RawImport': ('ItemTitle', 'Subject')}
+
+        # Connection tuning profiles. A negative cache_size is in KiB.
+        self.profiles = {
+            'interactive': {'journal_mode':'WAL',
+                            'synchronous':'NORMAL',
+                            'cache_size':-16384,
+                            'mmap_size':67108864,
+                            'temp_store':'MEMORY',
+                            'busy_timeout':5000,
+                            'query_only':'OFF'},
+            'bulk-import': {'journal_mode':'WAL',
+                            'synchronous':'NORMAL',
+                            'cache_size':-262144,
+                            'mmap_size':268435456,
+                            'temp_store':'MEMORY',
+                            'busy_timeout':30000,
+                            'query_only':'OFF'},
+            # A crash during a write with synchronous off can corrupt the whole
+            # file, so this is only used when ACCOUNTING_UNSAFE_IMPORT is set,
+            # and then only after a backup of the file. (see push_profile())
+            'bulk-import-unsafe': {'journal_mode':'WAL',
+                            'synchronous':'OFF',
+                            'cache_size':-262144,
+                            'mmap_size':268435456,
+                            'temp_store':'MEMORY',
+                            'busy_timeout':30000,
+                            'query_only':'OFF'},
+            'read-only-report': {'journal_mode':'WAL',
+                            'synchronous':'NORMAL',
+                            'cache_size':-65536,
+                            'mmap_size':268435456,
+                            'temp_store':'MEMORY',
+                            'busy_timeout':5000,
+                            'query_only':'ON'}}
+        self.unsafe_import = os.environ.get('ACCOUNTING_UNSAFE_IMPORT', '') != ''
+        self.backup_name = self.database_name + '.bak'
         self.open()
         locale.setlocale(locale.LC_ALL, 'en_US.UTF-8')
-        self.logger.set_level(Logger.INFO)
 
     @func_wrapper
     def open(self):
@@ -47,8 +110,14 @@ class Database(object):
         if not os.path.isfile(self.database_name):
             self.create_database()
 
-        self.db = sql.connect(self.database_name)
+        self.db = sql.connect(self.database_name, cached_statements=self.cached_statements)
         self.db.row_factory = sql.Row
+        self.profile = []
+        self.tx_depth = 0
+        self.tx_statements = 0
+        self.last_transaction = None
+        self.push_profile('interactive')
+        self.migrate()
 
     @func_wrapper
     def close(self):
@@ -59,7 +128,7 @@ class Database(object):
     def read_statement(self, fh):
         '''
         Read a statement from the *.sql file and return it. This skips comments and concatinates lines
-        until a ';' is read.
+        until a ';' that ends the statement is read.
 
         A comment is text that starts with a '#' and continues to the end of the line.
         '''
@@ -71,7 +140,8 @@ class Database(object):
             # If there is anything left, append it to the return value.
             if len(line) > 0:
                 retv += " %s"%(line)
-                if line[-1] == ';':
+                # a trigger body has ';' inside of it
+                if line[-1] == ';' and sql.complete_statement(retv):
                     break
 
         return retv
@@ -104,6 +174,141 @@ class Database(object):
         c.commit()
         c.close()
 
+    @func_wrapper
+    def _apply_profile(self, name, db=None):
+        '''
+        Set the connection pragmas from a tuning profile. The journal mode is only
+        changed when it is different, because that cannot be done in a transaction.
+        The connection is self.db unless another one is given.
+        '''
+        if not name in self.profiles:
+            raise Exception('Unknown database profile: %s'%(name))
+
+        if db is None:
+            db = self.db
+        prof = self.profiles[name]
+        mode = db.execute('PRAGMA journal_mode;').fetchone()[0]
+        if mode.upper() != prof['journal_mode'].upper():
+            db.commit()
+            db.execute('PRAGMA journal_mode = %s;'%(prof['journal_mode']))
+
+        for pragma in ('synchronous', 'cache_size', 'mmap_size', 'temp_store', 'busy_timeout', 'query_only'):
+            db.execute('PRAGMA %s = %s;'%(pragma, str(prof[pragma])))
+
+    @func_wrapper
+    def open_reader(self):
+        '''
+        Open another connection to the database with the read-only-report profile.
+        A connection can only be used by the thread that opened it, so a background
+        thread calls this itself. In WAL mode it reads without blocking self.db.
+        '''
+        db = sql.connect(self.database_name)
+        db.row_factory = sql.Row
+        self._apply_profile('read-only-report', db)
+        return db
+
+    @func_wrapper
+    def push_profile(self, name):
+        '''
+        Switch the connection to a tuning profile until pop_profile() is called. This
+        is used to temporarily tune the connection for something like an import.
+
+        When ACCOUNTING_UNSAFE_IMPORT is set, bulk-import becomes bulk-import-unsafe,
+        which does not sync at all, and the database is backed up to backup_name
+        first.
+        '''
+        if name == 'bulk-import' and self.unsafe_import:
+            self.backup(self.backup_name)
+            name = 'bulk-import-unsafe'
+        self._apply_profile(name)
+        self.profile.insert(0, name)
+
+    @func_wrapper
+    def backup(self, fname):
+        '''
+        Copy the committed state of the database to the file with the SQLite backup
+        API. This can not be done inside of transaction().
+        '''
+        if self.tx_depth > 0:
+            raise Exception('The database can not be backed up inside of a transaction')
+
+        self.db.commit()
+        dest = sql.connect(fname)
+        try:
+            self.db.backup(dest)
+        finally:
+            dest.close()
+        self.logger.info('Backed up the database to %s'%(fname))
+
+    @func_wrapper
+    def pop_profile(self):
+        '''
+        Restore the tuning profile that was in use before the last push_profile().
+        '''
+        if len(self.profile) > 1:
+            self.profile.pop(0)
+            self._apply_profile(self.profile[0])
+
+    @func_wrapper
+    def get_profile(self):
+        '''
+        Return the name of the tuning profile that is in use.
+        '''
+        return self.profile[0]
+
+    @func_wrapper
+    def get_schema_version(self):
+        '''
+        Return the schema version that is stored in the database.
+        '''
+        return self.db.execute('PRAGMA user_version;').fetchone()[0]
+
+    @func_wrapper
+    def get_migration_list(self):
+        '''
+        Return a sorted list of (number, file name) for the migration scripts. The
+        scripts are named like 001_indexes.sql, where the number is the schema
+        version that the script upgrades the database to.
+        '''
+        retv = []
+        for name in os.listdir(self.db_migration_dir):
+            if name.endswith('.sql'):
+                retv.append((int(name.split('_')[0]), name))
+        retv.sort()
+        return retv
+
+    @func_wrapper
+    def migrate(self):
+        '''
+        Upgrade the database in place by applying, in order, the migration scripts
+        that are newer than the stored schema version, up to data_version. Each
+        script and the new version number are committed together, so a failed
+        script leaves the database at the previous version.
+        '''
+        version = self.get_schema_version()
+        if version > self.data_version:
+            self.logger.warning('Database schema version %d is newer than %d'%(version, self.data_version))
+            return
+
+        for number, name in self.get_migration_list():
+            if number <= version or number > self.data_version:
+                continue
+
+            self.logger.msg('Applying database migration %s'%(name))
+            try:
+                self.db.execute('BEGIN;')
+                self.run_file(self.db, os.path.join(self.db_migration_dir, name))
+                self.db.execute('PRAGMA user_version = %d;'%(number))
+                self.db.commit()
+            except sql.Error as e:
+                self.db.rollback()
+                raise Exception('Cannot apply database migration "%s": %s'%(name, str(e)))
+
+            if number == 1:
+                count = self.db.execute('SELECT COUNT(*) FROM RawImportDuplicate;').fetchone()[0]
+                if count > 0:
+                    self.logger.warning('%d RawImport lines repeat a TransactionID, see RawImportDuplicate'%(count))
+
     @func_wrapper
     def get_columns(self, table):
         '''
@@ -128,24 +333,309 @@ class Database(object):
         return retv
 
     @func_wrapper
-    def execute(self, sql):
+    def execute(self, sql, vals=()):
         '''
-        Execute an arbitrary SQL statement.
+        Execute an arbitrary SQL statement. A statement that writes a lookup table
+        drops its cached maps.
         '''
-        return self.db.execute(sql)
+        self._invalidate_sql(sql)
+        return self.db.execute(sql, vals)
+
+    @func_wrapper
+    def _statement(self, op, table, cols=(), where=()):
+        '''
+        Return the parameterized SQL for an operation on a table. The text depends
+        only on the operation, the table and the columns, never on the values, so
+        the sqlite3 statement cache can reuse the compiled statement. The texts are
+        kept in an LRU that is the same size as the sqlite3 cache.
+
+        op      =   One of 'select', 'exists', 'insert', 'update', 'delete', 'join',
+                    'after', 'before' or 'index'.
+        cols    =   Tuple of columns to select, insert or update. For 'join' it is a
+                    tuple of (alias, column, pop_table, pop_column) tuples.
+        where   =   Tuple of columns that must be equal to a parameter. For 'index' it
+                    is a tuple of the number of IDs to add to the search index.
+        '''
+        key = (op, table, cols, where)
+        if key in self.statements:
+            self.statements.move_to_end(key)
+            self.statement_hits += 1
+            return self.statements[key]
+
+        self.statement_misses += 1
+        cond = ' AND '.join(['%s = ?'%(x) for x in where])
+        if op == 'select':
+            sql = 'SELECT %s FROM %s'%(','.join(cols), table)
+            if len(where) > 0:
+                sql += ' WHERE %s'%(cond)
+        elif op == 'exists':
+            sql = 'SELECT 1 FROM %s WHERE %s LIMIT 1'%(table, cond)
+        elif op == 'insert':
+            sql = 'INSERT INTO %s (%s) VALUES (%s)'%(table, ','.join(cols), ','.join(['?']*len(cols)))
+        elif op == 'update':
+            sql = 'UPDATE %s SET %s WHERE %s'%(table, ','.join(['%s=?'%(x) for x in cols]), cond)
+        elif op == 'delete':
+            sql = 'DELETE FROM %s WHERE %s'%(table, cond)
+        elif op == 'join':
+            fields = 't.*'
+            tables = '%s AS t'%(table)
+            for idx, item in enumerate(cols):
+                fields += ', j%d.%s AS %s'%(idx, item[3], item[0])
+                tables += ' LEFT JOIN %s AS j%d ON j%d.ID = t.%s'%(item[2], idx, idx, item[1])
+            sql = 'SELECT %s FROM %s WHERE %s'%(fields, tables, ' AND '.join(['t.%s = ?'%(x) for x in where]))
+        elif op == 'after':
+            sql = 'SELECT ID FROM %s WHERE ID > ? ORDER BY ID LIMIT ?'%(table)
+        elif op == 'before':
+            sql = 'SELECT ID FROM %s WHERE ID < ? ORDER BY ID DESC LIMIT ?'%(table)
+        elif op == 'index':
+            sql = "INSERT INTO %sSearch (rowid, %s) SELECT ID, %s FROM %s WHERE ID IN (%s) AND %s != ''"%(
+                            table, ','.join(cols), ','.join(cols), table, ','.join(['?']*where[0]),
+                            ' || '.join(["IFNULL(%s, '')"%(x) for x in cols]))
+        else:
+            raise Exception('Unknown statement operation: %s'%(op))
+        sql += ';'
+
+        self.statements[key] = sql
+        if len(self.statements) > self.cached_statements:
+            self.statements.popitem(last=False)
+
+        return sql
+
+    @func_wrapper
+    def _lookup(self, table, col):
+        '''
+        Return the cached maps for a column of one of the lookup tables. The 'ids' map
+        goes from the value to the ID and keeps the lowest ID when a value repeats. The
+        'values' map goes from the ID to the value. 'affinity' is the type affinity of
+        the column, used to convert a value the way SQLite would before it is looked
+        up. The table is read the first time it is used and again after a write to it.
+        '''
+        key = (table, col)
+        if key in self.lookups:
+            self.lookup_hits += 1
+            return self.lookups[key]
+
+        self.lookup_misses += 1
+        ids = {}
+        values = {}
+        for row in self.db.execute(self._statement('select', table, ('ID', col))):
+            values[row[0]] = row[1]
+            if not row[1] in ids:
+                ids[row[1]] = row[0]
+
+        affinity = 'NUMERIC'
+        for row in self.db.execute('PRAGMA table_info(%s);'%(table)):
+            if row[1] == col:
+                affinity = self._affinity(row[2])
+
+        self.lookups[key] = {'ids':ids, 'values':values, 'affinity':affinity}
+        return self.lookups[key]
+
+    @func_wrapper
+    def _lookup_id(self, table, col, val):
+        '''
+        Return the ID of the value in a lookup table, or None.
+        '''
+        entry = self._lookup(table, col)
+        return entry['ids'].get(self._coerce(entry['affinity'], val))
+
+    @func_wrapper
+    def _lookup_value(self, table, col, row_id):
+        '''
+        Return the value of the column in the row of a lookup table, or None.
+        '''
+        return self._lookup(table, col)['values'].get(self._coerce('INTEGER', row_id))
+
+    @func_wrapper
+    def _affinity(self, decl):
+        '''
+        Return the SQLite type affinity of a declared column type.
+        '''
+        decl = decl.upper()
+        if 'INT' in decl:
+            return 'INTEGER'
+        if 'CHAR' in decl or 'CLOB' in decl or 'TEXT' in decl:
+            return 'TEXT'
+        if decl == '' or 'BLOB' in decl:
+            return 'BLOB'
+        if 'REAL' in decl or 'FLOA' in decl or 'DOUB' in decl:
+            return 'REAL'
+        return 'NUMERIC'
+
+    @func_wrapper
+    def _coerce(self, affinity, val):
+        '''
+        Convert a value the way SQLite converts it when it is compared with a column
+        of the affinity, so that a cached lookup gives the same answer as a query. For
+        example '1' finds the ID 1 and 1 finds the name '1'.
+        '''
+        if val is None or isinstance(val, bytes):
+            return val
+        if isinstance(val, bool):
+            val = int(val)
+
+        if affinity == 'TEXT':
+            if isinstance(val, (int, float)):
+                return str(val)
+        elif affinity != 'BLOB' and isinstance(val, str):
+            if re.match(r'^\s*[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?\s*$', val) is None:
+                return val
+            num = float(val)
+            if affinity != 'REAL' and num.is_integer() and abs(num) < 2**63:
+                return int(num)
+            return num
+
+        return val
+
+    @func_wrapper
+    def _invalidate(self, table):
+        '''
+        Drop the cached maps of a lookup table after it has been written.
+        '''
+        if table in self.lookup_tables:
+            for key in list(self.lookups.keys()):
+                if key[0] == table:
+                    del self.lookups[key]
+
+    def _invalidate_sql(self, statement):
+        '''
+        Drop the cached maps of the lookup tables that a statement may write. It is
+        not wrapped for logging because it runs for every statement given to
+        execute().
+        '''
+        if len(self.lookups) == 0:
+            return
+
+        words = set(re.findall(r'\w+', statement.upper()))
+        if words.isdisjoint(('INSERT', 'UPDATE', 'DELETE', 'REPLACE', 'DROP', 'ALTER')):
+            return
+
+        for table in self.lookup_tables:
+            if table.upper() in words:
+                self._invalidate(table)
+
+    @func_wrapper
+    def get_lookup_stats(self):
+        '''
+        Return a dict with the hit and miss counts of the lookup table cache.
+        '''
+        total = self.lookup_hits + self.lookup_misses
+        if total == 0:
+            rate = 0.0
+        else:
+            rate = self.lookup_hits / total
+
+        return {'hits':self.lookup_hits,
+                'misses':self.lookup_misses,
+                'hit_rate':rate,
+                'size':len(self.lookups)}
+
+    @func_wrapper
+    def get_statement_stats(self):
+        '''
+        Return a dict with the hit and miss counts of the prepared statement cache.
+        '''
+        return {'hits':self.statement_hits,
+                'misses':self.statement_misses,
+                'size':len(self.statements),
+                'cached_statements':self.cached_statements}
 
     @func_wrapper
     def commit(self):
         '''
-        Commit the database to disk.
+        Commit the database to disk. Inside of transaction() this does nothing,
+        because the outermost transaction commits everything at once.
         '''
-        self.db.commit()
+        if self.tx_depth == 0:
+            self.db.commit()
+
+    @func_wrapper
+    @contextmanager
+    def transaction(self, name='transaction'):
+        '''
+        Context manager that runs a block of database work as one atomic unit.
+
+            with self.data.transaction('save'):
+                ...
+
+        The outermost block opens a transaction and commits it once at the end. A
+        nested block uses a SAVEPOINT, so it can fail and be rolled back without
+        losing the work of the enclosing block. When an exception leaves a block,
+        the work of that block is rolled back and the exception is raised again.
+
+        A summary of the outermost transaction (name, number of statements and
+        seconds) is logged and kept in last_transaction.
+        '''
+        if self.tx_depth == 0:
+            start = time.time()
+            self.tx_statements = 0
+            self.db.set_trace_callback(self._count_statement)
+            if not self.db.in_transaction:
+                self.db.execute('BEGIN;')
+
+            self.tx_depth += 1
+            try:
+                yield self
+            except BaseException:
+                self.tx_depth -= 1
+                self.db.rollback()
+                self.lookups = {}   # may hold rows that were rolled back
+                self._end_transaction(name, start, False)
+                raise
+
+            self.tx_depth -= 1
+            self.db.commit()
+            self._end_transaction(name, start, True)
+        else:
+            savepoint = 'sp%d'%(self.tx_depth)
+            self.db.execute('SAVEPOINT %s;'%(savepoint))
+
+            self.tx_depth += 1
+            try:
+                yield self
+            except BaseException:
+                self.tx_depth -= 1
+                self.db.execute('ROLLBACK TO %s;'%(savepoint))
+                self.db.execute('RELEASE %s;'%(savepoint))
+                self.lookups = {}
+                raise
+
+            self.tx_depth -= 1
+            self.db.execute('RELEASE %s;'%(savepoint))
+
+    def _count_statement(self, statement):
+        '''
+        Trace callback that counts the statements run in a transaction. This is not
+        wrapped for logging because it runs for every statement.
+        '''
+        self.tx_statements += 1
+
+    @func_wrapper
+    def _end_transaction(self, name, start, committed):
+        '''
+        Stop counting statements and log the summary of a transaction.
+        '''
+        self.db.set_trace_callback(None)
+        if committed:
+            state = 'committed'
+        else:
+            state = 'rolled back'
+
+        self.last_transaction = {'name':name,
+                                 'statements':self.tx_statements,
+                                 'seconds':time.time() - start,
+                                 'committed':committed}
+        self.logger.info('Transaction %s %s: %d statements in %0.3f seconds'%(
+                    name, state, self.tx_statements, self.last_transaction['seconds']))
 
     @func_wrapper
     def populate_list(self, table, column):
         '''
         Return a list with all of the items then the column of the table.
         '''
+        if table in self.lookup_tables:
+            return list(self._lookup(table, column)['values'].values())
+
         curs = self.execute('select %s from %s;'%(column, table))
         retv = []
         for item in curs:
@@ -158,28 +648,234 @@ class Database(object):
         '''
         Return a dict of all of the columns in the row that has the specified ID.
         '''
-        curs = self.execute('select * from %s where ID = %d;'%(table, ID)).fetchall()
-        try:
-            retv = dict(curs[0])
-            return retv
-        except IndexError:
+        sql = self._statement('select', table, ('*',), ('ID',))
+        row = self.db.execute(sql, (ID,)).fetchone()
+        if row is None:
+            return None
+        else:
+            return dict(row)
+
+    @func_wrapper
+    def get_row_with_joins(self, table, ID, joins=()):
+        '''
+        Return a dict of all of the columns in the row that has the specified ID, plus
+        the display values of the IDs that point into other tables, in one query.
+
+        joins   =   List of (alias, column, pop_table, pop_column). The value of
+                    pop_column in the pop_table row whose ID is in column is stored
+                    in the dict under alias. Lookup tables are read from the lookup
+                    cache and the others are joined in the SELECT.
+        '''
+        cached = []
+        joined = []
+        for item in joins:
+            if item[2] in self.lookup_tables:
+                cached.append(item)
+            else:
+                joined.append(item)
+
+        sql = self._statement('join', table, tuple(joined), ('ID',))
+        row = self.db.execute(sql, (ID,)).fetchone()
+        if row is None:
             return None
 
+        retv = dict(row)
+        for alias, column, pop_table, pop_column in cached:
+            retv[alias] = self._lookup_value(pop_table, pop_column, retv[column])
+
+        return retv
+
+    @func_wrapper
+    def get_page(self, table, cols, order='ID', reverse=False, after=None, prefix=None,
+                    prefix_col=None, joins=(), count=100):
+        '''
+        Return a page of up to count rows from a table, sorted by a column, for a
+        browser. Paging uses the (order, ID) key of the last row of the previous page
+        instead of an OFFSET, so every page costs the same when the order column is
+        indexed. Each row has 'ID', the columns and 'sort_key', which is the value of
+        the order column. Text is sorted and matched without regard to case, so the
+        index on the order column has to be COLLATE NOCASE. (see migration 9)
+
+        cols        =   Tuple of the columns and join aliases to return.
+        order       =   Column of the table to sort by. It must not contain NULLs.
+        reverse     =   Sort in descending order.
+        after       =   (sort_key, ID) of the row to start after, or None for the start.
+        prefix      =   Only return rows where prefix_col starts with this text, in
+                        any case. This is a range on the column, so it can use a
+                        NOCASE index on it.
+        joins       =   List of (alias, column, pop_table, pop_column) as in
+                        get_row_with_joins().
+        '''
+        tables = '%s AS t'%(table)
+        joined = {}
+        for idx, item in enumerate(joins):
+            joined[item[0]] = 'j%d.%s AS %s'%(idx, item[3], item[0])
+            tables += ' LEFT JOIN %s AS j%d ON j%d.ID = t.%s'%(item[2], idx, idx, item[1])
+
+        fields = ['t.ID', 't.%s AS sort_key'%(order)]
+        for col in cols:
+            fields.append(joined.get(col, 't.%s'%(col)))
+
+        if order == 'ID':
+            key = 't.ID'
+        else:
+            key = 't.%s COLLATE NOCASE'%(order)
+
+        conds = []
+        vals = []
+        if not after is None:
+            # The row value alone is not used to seek in a NOCASE index, the first
+            # comparison is.
+            conds.append('%s %s= ? AND (%s, t.ID) %s (?, ?)'%(key, '<' if reverse else '>',
+                            key, '<' if reverse else '>'))
+            vals.extend([after[0], after[0], after[1]])
+        if not prefix is None and prefix != '':
+            conds.append('t.%s COLLATE NOCASE >= ?'%(prefix_col))
+            vals.append(prefix)
+            end = self._prefix_end(prefix)
+            if not end is None:
+                conds.append('t.%s COLLATE NOCASE < ?'%(prefix_col))
+                vals.append(end)
+
+        sql = 'SELECT %s FROM %s'%(', '.join(fields), tables)
+        if len(conds) > 0:
+            sql += ' WHERE %s'%(' AND '.join(conds))
+        direction = ' DESC' if reverse else ''
+        sql += ' ORDER BY %s%s, t.ID%s LIMIT ?;'%(key, direction, direction)
+        vals.append(count)
+
+        return self.db.execute(sql, vals).fetchall()
+
+    @func_wrapper
+    def _prefix_end(self, prefix):
+        '''
+        Return the first text after all of the text that starts with the prefix in
+        NOCASE order, or None if there is none. NOCASE only folds A-Z to a-z, so the
+        last character is folded the same way before it is incremented.
+        '''
+        prefix = prefix.rstrip(chr(0x10ffff))
+        if prefix == '':
+            return None
+
+        last = prefix[-1]
+        if 'A' <= last <= 'Z':
+            last = last.lower()
+        last = chr(ord(last) + 1)
+        if last == 'A':
+            # '@' is followed by '[' once A-Z are folded away
+            last = '['
+        return prefix[:-1] + last
+
+    @func_wrapper
+    def find_items(self, table, column, text, count=50):
+        '''
+        Return a list of up to count (ID, value) tuples for the rows where the column
+        matches the text, for search as you type. Rows where the column starts with
+        the text come first, sorted, and are read as a range on the index of the
+        column. If there are fewer than count of them, they are followed by other
+        matches. When the column is in the search index these are the rows with a
+        word that starts with each word of the text, otherwise they are the rows that
+        contain the text anywhere, in any case.
+        '''
+        retv = [(x['ID'], x[column]) for x in self.get_page(table, (column,), column,
+                        prefix=text, prefix_col=column, count=count)]
+        if len(retv) >= count or text == '':
+            return retv
+
+        found = [x[0] for x in retv]
+        if column in self.search_tables.get(table, ()):
+            # any word in the column that starts with the words of the text
+            sql = 'SELECT s.rowid, t.%s FROM %sSearch AS s JOIN %s AS t ON t.ID = s.rowid WHERE %sSearch MATCH ? AND s.rowid NOT IN (%s) ORDER BY s.rank LIMIT ?;'%(
+                            column, table, table, table, ','.join(['?']*len(found)))
+            vals = ['%s : (%s)'%(column, self._match_text(text))]
+        else:
+            sql = "SELECT ID, %s FROM %s WHERE %s LIKE ? ESCAPE '\\' AND ID NOT IN (%s) ORDER BY %s LIMIT ?;"%(
+                            column, table, column, ','.join(['?']*len(found)), column)
+            vals = ['%%%s%%'%(text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_'))]
+
+        for row in self.db.execute(sql, vals + found + [count - len(retv)]):
+            retv.append((row[0], row[1]))
+
+        return retv
+
+    @func_wrapper
+    def _match_text(self, text):
+        '''
+        Turn what the user typed into an FTS5 query. Each word is quoted, so
+        punctuation is not read as query syntax, and the last word matches as a
+        prefix because it may not be finished yet.
+        '''
+        words = ['"%s"'%(x.replace('"', '""')) for x in text.split()]
+        if len(words) > 0:
+            words[-1] += '*'
+        return ' '.join(words)
+
+    @func_wrapper
+    def search(self, table, text, count=50):
+        '''
+        Return a list of up to count IDs of the rows of the table that contain all
+        of the words in the text, best match first. The table must be one of the
+        search_tables.
+        '''
+        if not table in self.search_tables:
+            raise Exception("Table %s does not have a search index"%(table))
+
+        query = self._match_text(text)
+        if query == '':
+            return []
+
+        sql = 'SELECT rowid FROM %sSearch WHERE %sSearch MATCH ? ORDER BY rank LIMIT ?;'%(table, table)
+        return [x[0] for x in self.db.execute(sql, (query, count))]
+
+    @func_wrapper
+    def search_all(self, text, count=50):
+        '''
+        Search all of the search_tables and return a list of up to count
+        (table, ID) tuples, best match first.
+        '''
+        query = self._match_text(text)
+        if query == '':
+            return []
+
+        sql = ' UNION ALL '.join(["SELECT '%s', rowid, rank FROM %sSearch WHERE %sSearch MATCH ?"%(x, x, x)
+                        for x in self.search_tables])
+        sql += ' ORDER BY 3 LIMIT ?;'
+        vals = [query] * len(self.search_tables) + [count]
+        return [(x[0], x[1]) for x in self.db.execute(sql, vals)]
+
     @func_wrapper
     def get_id_by_row(self, table, col, val):
         '''
         Return a dictionary of the columns in the row where a data element matches the value given.
         '''
-        if type(val) is str:
-            sql = 'SELECT ID FROM %s WHERE %s = \"%s\";'%(table, col, val)
-        else:
-            sql = 'SELECT ID FROM %s WHERE %s = %s;'%(table, col, val)
-        row = self.execute(sql).fetchall()
+        if table in self.lookup_tables:
+            return self._lookup_id(table, col, val)
+
+        sql = self._statement('select', table, ('ID',), (col,))
+        row = self.db.execute(sql, (val,)).fetchone()
 
-        if len(row) == 0:
+        if row is None:
             return None
         else:
-            return dict(row[0])['ID']
+            return row['ID']
+
+    @func_wrapper
+    def get_id_map(self, table, col):
+        '''
+        Return a dictionary that maps every value in the column to the ID of the row
+        that holds it. When a value appears more than once, the lowest ID is kept so
+        that the result agrees with get_id_by_row().
+        '''
+        if table in self.lookup_tables:
+            return dict(self._lookup(table, col)['ids'])
+
+        retv = {}
+        sql = 'SELECT ID, %s FROM %s ORDER BY ID;'%(col, table)
+        for row in self.execute(sql):
+            if not row[1] in retv:
+                retv[row[1]] = row[0]
+
+        return retv
 
     @func_wrapper
     def get_cursor(self):
@@ -193,15 +889,25 @@ class Database(object):
         '''
         Get a list of all of the IDs in the table
         '''
-        retv = []
-        if where is None:
-            sql = 'SELECT ID FROM %s;'%(table)
-        else:
-            sql = 'SELECT ID FROM %s WHERE %s;'%(table, where)
-        cur = self.execute(sql)
-        for item in cur:
-            retv.append(item[0])
+        return list(self.iter_id_list(table, where))
 
+    @func_wrapper
+    def get_ids_after(self, table, row_id, count):
+        '''
+        Return up to count IDs that come after row_id, in ascending order. This
+        uses the primary key, so the cost does not depend on the size of the table.
+        '''
+        cur = self.db.execute(self._statement('after', table), (row_id, count))
+        return [x[0] for x in cur.fetchall()]
+
+    @func_wrapper
+    def get_ids_before(self, table, row_id, count):
+        '''
+        Return up to count IDs that come before row_id, in ascending order.
+        '''
+        cur = self.db.execute(self._statement('before', table), (row_id, count))
+        retv = [x[0] for x in cur.fetchall()]
+        retv.reverse()
         return retv
 
     @func_wrapper
@@ -209,11 +915,7 @@ class Database(object):
         '''
         Get a generic list of rows based on more than one criteria
         '''
-        retv = []
-        sql = 'SELECT * FROM %s WHERE %s'%(table, where)
-        cur = self.execute(sql)
-        for item in cur:
-            retv.append(dict(item))
+        retv = list(self.iter_row_list(table, where))
 
         if len(retv) == 0:
             return None
@@ -225,15 +927,7 @@ class Database(object):
         '''
         Get the list of all rows where the column has a certain value
         '''
-        retv = []
-        if type(val) is str:
-            sql = 'SELECT * FROM %s WHERE %s = \"%s\";'%(table, col, val)
-        else:
-            sql = 'SELECT * FROM %s WHERE %s = %s;'%(table, col, val)
-
-        cur = self.execute(sql)
-        for item in cur:
-            retv.append(dict(item))
+        retv = list(self.iter_row_list_by_col(table, col, val))
 
         if len(retv) == 0:
             return None
@@ -241,51 +935,128 @@ class Database(object):
             return retv
 
     @func_wrapper
-    def get_id_by_name(self, table, col, val):
+    def _iter_cursor(self, sql, vals, row_type, fetch_size):
         '''
-        Return the ID where the data in the column matches the value. Only returns the
-        first match.
+        Generator that runs a query on its own cursor and yields the rows in batches
+        of fetch_size, so that the whole result is never held in memory.
+
+        row_type    =   'dict' for a dict per row, 'row' for a named sqlite3.Row or
+                        'tuple' for a plain tuple.
         '''
-        if type(val) is str:
-            sql = 'select ID from %s where %s = \"%s\";'%(table, col, val)
+        if fetch_size is None:
+            fetch_size = self.fetch_size
+
+        cur = self.db.cursor()
+        if row_type == 'tuple':
+            cur.row_factory = None
+        cur.execute(sql, vals)
+
+        while True:
+            rows = cur.fetchmany(fetch_size)
+            if len(rows) == 0:
+                break
+            for row in rows:
+                if row_type == 'dict':
+                    yield dict(row)
+                else:
+                    yield row
+
+    @func_wrapper
+    def iter_id_list(self, table, where=None, fetch_size=None):
+        '''
+        Generator version of get_id_list().
+        '''
+        if where is None:
+            sql = 'SELECT ID FROM %s;'%(table)
         else:
-            sql = 'select ID from %s where %s = %s;'%(table, col, str(val))
+            sql = 'SELECT ID FROM %s WHERE %s;'%(table, where)
 
-        curs = self.execute(sql)
-        recs = curs.fetchall()
+        for row in self._iter_cursor(sql, (), 'tuple', fetch_size):
+            yield row[0]
 
-        retv = None
-        for row in recs:
-            retv =  row[0]
-            break
+    @func_wrapper
+    def iter_row_list(self, table, where=None, row_type='dict', fetch_size=None):
+        '''
+        Generator version of get_row_list(). Yields nothing when no rows match.
+        '''
+        if where is None:
+            sql = 'SELECT * FROM %s;'%(table)
+        else:
+            sql = 'SELECT * FROM %s WHERE %s;'%(table, where)
+
+        return self._iter_cursor(sql, (), row_type, fetch_size)
+
+    @func_wrapper
+    def get_rows_by_ids(self, table, ids, where=None, chunk_size=None):
+        '''
+        Return a list of dicts for the rows that have the IDs, in ID order. The IDs
+        are read chunk_size at a time. The optional where is an extra condition
+        that the rows must meet.
+        '''
+        if chunk_size is None:
+            chunk_size = self.chunk_size
+        ids = list(ids)
+
+        retv = []
+        for idx in range(0, len(ids), chunk_size):
+            chunk = ids[idx:idx+chunk_size]
+            sql = 'SELECT * FROM %s WHERE ID IN (%s)'%(table, ','.join(['?']*len(chunk)))
+            if not where is None:
+                sql += ' AND %s'%(where)
+            retv.extend([dict(x) for x in self.db.execute(sql+';', chunk)])
 
+        retv.sort(key=lambda x: x['ID'])
         return retv
 
+    @func_wrapper
+    def iter_row_list_by_col(self, table, col, val, row_type='dict', fetch_size=None):
+        '''
+        Generator version of get_row_list_by_col(). Yields nothing when no rows match.
+        '''
+        sql = self._statement('select', table, ('*',), (col,))
+        return self._iter_cursor(sql, (val,), row_type, fetch_size)
+
+    @func_wrapper
+    def get_id_by_name(self, table, col, val):
+        '''
+        Return the ID where the data in the column matches the value. Only returns the
+        first match.
+        '''
+        if table in self.lookup_tables:
+            return self._lookup_id(table, col, val)
+
+        sql = self._statement('select', table, ('ID',), (col,))
+        row = self.db.execute(sql, (val,)).fetchone()
+
+        if row is None:
+            return None
+        else:
+            return row[0]
+
     @func_wrapper
     def get_single_value(self, table, col, row_id):
         '''
         Retrieve a single value where the table, column and row ID are known.
         '''
-        sql = 'SELECT %s FROM %s WHERE ID=%d;'%(col, table, row_id)
-        curs = self.execute(sql)
-        recs = curs.fetchall()
+        if table in self.lookup_tables:
+            return self._lookup_value(table, col, row_id)
 
-        retv = None
-        for row in recs:
-            retv =  row[0]
-            break
+        sql = self._statement('select', table, (col,), ('ID',))
+        row = self.db.execute(sql, (row_id,)).fetchone()
 
-        return retv
+        if row is None:
+            return None
+        else:
+            return row[0]
 
     @func_wrapper
     def set_single_value(self, table, col, row_id, val):
         '''
         Retrieve a single value where the table, column and row ID are known.
         '''
-        vals = tuple([val])
-        sql = 'UPDATE %s SET %s=? WHERE ID=%d;'%(table, col, row_id)
-
-        return self.db.execute(sql, vals)
+        self._invalidate(table)
+        sql = self._statement('update', table, (col,), ('ID',))
+        return self.db.execute(sql, (val, row_id))
 
     @func_wrapper
     def insert_row(self, table, rec):
@@ -293,12 +1064,334 @@ class Database(object):
         Insert a row from a dictionary. This expects a dictionary where the keys are the column names and
         the values are to be inserted in to the columns.
         '''
-        keys = ','.join(rec.keys())
-        qmks = ','.join(list('?'*len(rec)))
-        vals = tuple(rec.values())
+        self._invalidate(table)
+        sql = self._statement('insert', table, tuple(rec.keys()))
+        return self.db.execute(sql, tuple(rec.values())).lastrowid
+
+    @func_wrapper
+    def insert_rows(self, table, recs, chunk_size=None):
+        '''
+        Insert many rows from an iterable of dictionaries. The rows are grouped by
+        their set of columns and each group is written with executemany() in chunks
+        of chunk_size rows. All of the chunks are written in the current transaction.
+
+        Returns a list of the new row IDs in the same order as the rows were given,
+        so that the caller can map them back to the source rows.
+        '''
+        if chunk_size is None:
+            chunk_size = self.chunk_size
+        self._invalidate(table)
 
-        sql = 'INSERT INTO %s (%s) VALUES (%s);'%(table, keys, qmks)
-        return self.db.execute(sql, vals).lastrowid
+        retv = []
+        groups = {}
+        for rec in recs:
+            keys = tuple(rec.keys())
+            if not keys in groups:
+                groups[keys] = []
+            groups[keys].append((len(retv), tuple(rec.values())))
+            retv.append(None)
+            if len(groups[keys]) >= chunk_size:
+                self._insert_chunk(table, keys, groups[keys], retv)
+                groups[keys] = []
+
+        for keys in groups:
+            if len(groups[keys]) > 0:
+                self._insert_chunk(table, keys, groups[keys], retv)
+
+        return retv
+
+    @func_wrapper
+    def _insert_chunk(self, table, keys, rows, ids):
+        '''
+        Insert one chunk of rows that have the same columns and store the new row IDs
+        in the ids list. A chunk is written by one statement on one connection, so the
+        new IDs are consecutive and end with last_insert_rowid().
+        '''
+        sql = self._statement('insert', table, keys)
+        search = table in self.search_tables
+        if search:
+            # the chunk is added to the search index below, not by the trigger
+            self.db.execute('UPDATE SearchSync SET bulk = 1;')
+        try:
+            self.db.executemany(sql, [row[1] for row in rows])
+        finally:
+            if search:
+                self.db.execute('UPDATE SearchSync SET bulk = 0;')
+
+        if 'ID' in keys:
+            pos = keys.index('ID')
+            for idx, vals in rows:
+                ids[idx] = vals[pos]
+        else:
+            last = self.db.execute('SELECT last_insert_rowid();').fetchone()[0]
+            first = last - len(rows) + 1
+            for offset, row in enumerate(rows):
+                ids[row[0]] = first + offset
+
+        if search:
+            chunk = [ids[row[0]] for row in rows]
+            self.db.execute(self._statement('index', table, self.search_tables[table], (len(chunk),)), chunk)
+
+    @func_wrapper
+    def update_rows_by_id(self, table, recs, chunk_size=None):
+        '''
+        Update many rows from an iterable of dictionaries. Each dictionary must have
+        the ID of the row to update and the columns to change. The rows are grouped
+        by their set of columns and each group is written with executemany() in
+        chunks of chunk_size rows, all in the current transaction.
+
+        Returns the number of rows that were updated.
+        '''
+        if chunk_size is None:
+            chunk_size = self.chunk_size
+        self._invalidate(table)
+
+        retv = 0
+        groups = {}
+        for rec in recs:
+            keys = tuple([x for x in rec.keys() if x != 'ID'])
+            if not keys in groups:
+                groups[keys] = []
+            groups[keys].append(tuple([rec[x] for x in keys]) + (rec['ID'],))
+            if len(groups[keys]) >= chunk_size:
+                retv += self._update_chunk(table, keys, groups[keys])
+                groups[keys] = []
+
+        for keys in groups:
+            if len(groups[keys]) > 0:
+                retv += self._update_chunk(table, keys, groups[keys])
+
+        return retv
+
+    @func_wrapper
+    def _update_chunk(self, table, keys, rows):
+        '''
+        Update one chunk of rows that change the same columns. Returns the number of
+        rows that were updated.
+        '''
+        sql = self._statement('update', table, keys, ('ID',))
+        return self.db.executemany(sql, rows).rowcount
+
+    @func_wrapper
+    def add_to_column(self, table, col, amounts):
+        '''
+        Add an amount to a numeric column of each row in a dict of {ID: amount}. This
+        is one UPDATE per row, run with executemany(), no matter how many amounts
+        were added up to make it.
+        '''
+        self._invalidate(table)
+        sql = 'UPDATE %s SET %s = %s + ? WHERE ID = ?;'%(table, col, col)
+        self.db.executemany(sql, [(amount, ID) for ID, amount in amounts.items()])
+
+    @func_wrapper
+    def add_to_rollups(self, amounts):
+        '''
+        Add posted amounts to the ledger rollups. The amounts are a dict of
+        {(account ID, 'YYYY-MM-DD'): amount}. For each rollup table and period this
+        creates the row if it is new, adds to its amount and adds to the balance of
+        it and of the later periods of the account.
+        '''
+        for table, size in self.rollups.items():
+            totals = {}
+            for (account, date), amount in amounts.items():
+                key = (account, date[:size])
+                totals[key] = totals.get(key, 0.0) + amount
+            if len(totals) == 0:
+                continue
+
+            self.db.executemany('INSERT INTO %s (account_ID, period, amount, balance) VALUES (?, ?, 0, '
+                                'IFNULL((SELECT balance FROM %s WHERE account_ID = ? AND period < ? '
+                                'ORDER BY period DESC LIMIT 1), 0)) ON CONFLICT DO NOTHING;'%(table, table),
+                                [(a, p, a, p) for a, p in totals])
+            self.db.executemany('UPDATE %s SET amount = amount + ? WHERE account_ID = ? AND period = ?;'%(table),
+                                [(v, a, p) for (a, p), v in totals.items()])
+            self.db.executemany('UPDATE %s SET balance = balance + ? WHERE account_ID = ? AND period >= ?;'%(table),
+                                [(v, a, p) for (a, p), v in totals.items()])
+
+    @func_wrapper
+    def _ledger_legs(self, where):
+        '''
+        Return the SQL of a select of the (account_ID, date, amount) of each side of
+        the GenericTransaction rows where the clause is true. The amount is negative
+        on the from account. The clause is used twice, so it takes named parameters.
+        '''
+        return ('SELECT to_account_ID AS account_ID, date, gross AS amount FROM GenericTransaction '
+                'WHERE date IS NOT NULL AND to_account_ID IS NOT NULL AND %s '
+                'UNION ALL '
+                'SELECT from_account_ID, date, -gross FROM GenericTransaction '
+                'WHERE date IS NOT NULL AND from_account_ID IS NOT NULL AND %s'%(where, where))
+
+    @func_wrapper
+    def rebuild_rollups(self, tolerance=0.005):
+        '''
+        Recompute the ledger rollups with set based SQL and replace the stored ones.
+        The days after the last close are computed from GenericTransaction starting
+        with the balances of its snapshot, and the days before it are frozen. The
+        months are then summed from the days.
+
+        Returns a dict for each rollup table of the number of rows and the list of
+        (account ID, period, stored balance, computed balance) where they were
+        different by more than the tolerance, which is the drift. A missing row
+        shows as None. 'Account' has the same for Account.total against the
+        computed balance.
+        '''
+        retv = {}
+        with self.transaction('rebuild_rollups'):
+            close = self.get_last_close()
+            if close is None:
+                close = {'ID':None, 'date':''}
+
+            # The balance of a month is the one of its last day, which SQLite takes
+            # from the row that MAX() picked.
+            sources = {'AccountDay': ('SELECT l.account_ID, l.period, l.amount, IFNULL(s.balance, 0) + '
+                            'SUM(l.amount) OVER (PARTITION BY l.account_ID ORDER BY l.period) AS balance FROM '
+                            '(SELECT account_ID, date AS period, SUM(amount) AS amount FROM (%s) '
+                            'GROUP BY account_ID, date) AS l '
+                            'LEFT JOIN AccountSnapshot AS s ON s.account_ID = l.account_ID AND s.close_ID = :close'
+                            %(self._ledger_legs('date > :start')), close['date']),
+                       'AccountMonth': ('SELECT account_ID, month AS period, amount, balance FROM '
+                            '(SELECT account_ID, substr(period, 1, 7) AS month, SUM(amount) AS amount, balance, '
+                            'MAX(period) FROM AccountDay GROUP BY account_ID, month)', '')}
+
+            for table in self.rollups:
+                source, start = sources[table]
+                vals = {'close':close['ID'], 'start':start, 'tolerance':tolerance}
+                self.db.execute('DROP TABLE IF EXISTS temp.Rebuild;')
+                self.db.execute('CREATE TEMP TABLE Rebuild AS %s;'%(source), vals)
+
+                drift = self.db.execute('SELECT r.account_ID, r.period, t.balance, r.balance '
+                    'FROM temp.Rebuild AS r LEFT JOIN %s AS t USING (account_ID, period) '
+                    'WHERE t.balance IS NULL OR abs(t.balance - r.balance) > :tolerance '
+                    'UNION ALL '
+                    'SELECT t.account_ID, t.period, t.balance, NULL FROM %s AS t '
+                    'LEFT JOIN temp.Rebuild AS r USING (account_ID, period) '
+                    'WHERE r.account_ID IS NULL AND t.period > :start '
+                    'ORDER BY 1, 2;'%(table, table), vals).fetchall()
+
+                self.db.execute('DELETE FROM %s WHERE period > ?;'%(table), (start,))
+                self.db.execute('INSERT INTO %s (account_ID, period, amount, balance) '
+                    'SELECT account_ID, period, amount, balance FROM temp.Rebuild;'%(table))
+                count = self.db.execute('SELECT COUNT(*) FROM %s;'%(table)).fetchone()[0]
+                retv[table] = {'rows':count, 'drift':[tuple(x) for x in drift]}
+
+            self.db.execute('DROP TABLE temp.Rebuild;')
+            self.note_ledger_change(('*',))
+            drift = self.db.execute('SELECT a.ID, NULL, a.total, IFNULL(d.balance, 0) FROM Account AS a '
+                'LEFT JOIN AccountDay AS d ON d.account_ID = a.ID AND d.period = '
+                '(SELECT MAX(period) FROM AccountDay WHERE account_ID = a.ID) '
+                'WHERE abs(a.total - IFNULL(d.balance, 0)) > ?;', (tolerance,)).fetchall()
+            retv['Account'] = {'rows':self.db.execute('SELECT COUNT(*) FROM Account;').fetchone()[0],
+                               'drift':[tuple(x) for x in drift]}
+
+        return retv
+
+    @func_wrapper
+    def get_last_close(self, db=None):
+        '''
+        Return the last close of the books as a dict with the ID and the date, or
+        None if the books were never closed. The connection is self.db unless
+        another one is given.
+        '''
+        if db is None:
+            db = self.db
+        row = db.execute('SELECT ID, date FROM BookClose ORDER BY date DESC LIMIT 1;').fetchone()
+        if row is None:
+            return None
+        return {'ID':row[0], 'date':row[1]}
+
+    @func_wrapper
+    def close_books(self, date):
+        '''
+        Close the books through the date (YYYY-MM-DD). The balance of each account at
+        the end of the date is written to AccountSnapshot. It is the snapshot of the
+        last close plus the legs after it, which the date index finds without reading
+        the rest of the ledger. After this the legs through the date can not be
+        added, changed or deleted. (see migration 7)
+
+        Returns a dict with the ID and the date of the close and the balances.
+        '''
+        with self.transaction('close_books'):
+            last = self.get_last_close()
+            if last is None:
+                last = {'ID':None, 'date':''}
+            elif date <= last['date']:
+                raise Exception('The books are already closed through %s'%(last['date']))
+
+            close_id = self.db.execute('INSERT INTO BookClose (date, closed_at) VALUES (?, ?);',
+                            (date, int(time.time()))).lastrowid
+            self.db.execute('INSERT INTO AccountSnapshot (close_ID, account_ID, balance) '
+                'SELECT :close, a.ID, IFNULL(s.balance, 0) + IFNULL(l.amount, 0) FROM Account AS a '
+                'LEFT JOIN AccountSnapshot AS s ON s.close_ID = :last AND s.account_ID = a.ID '
+                'LEFT JOIN (SELECT account_ID, SUM(amount) AS amount FROM (%s) GROUP BY account_ID) AS l '
+                'ON l.account_ID = a.ID;'%(self._ledger_legs('date > :start AND date <= :end')),
+                {'close':close_id, 'last':last['ID'], 'start':last['date'], 'end':date})
+            balances = dict([tuple(x) for x in self.db.execute('SELECT account_ID, balance FROM AccountSnapshot '
+                            'WHERE close_ID = ?;', (close_id,))])
+            # No month changes, but the reports have to see the close.
+            self.note_ledger_change()
+
+        self.logger.info('Closed the books through %s'%(date))
+        return {'ID':close_id, 'date':date, 'balances':balances}
+
+    @func_wrapper
+    def note_ledger_change(self, periods=(None,)):
+        '''
+        Add a version to the ledger change counter with the months (YYYY-MM) that
+        changed. See migration 6. Returns the new version.
+        '''
+        version = self.get_ledger_version(self.db) + 1
+        self.db.executemany('INSERT INTO LedgerChange (version, period) VALUES (?, ?);',
+                            [(version, x) for x in periods])
+        return version
+
+    @func_wrapper
+    def get_ledger_version(self, db=None):
+        '''
+        Return the current version of the ledger change counter. The connection is
+        self.db unless another one is given.
+        '''
+        if db is None:
+            db = self.db
+        return db.execute('SELECT IFNULL(MAX(version), 0) FROM LedgerChange;').fetchone()[0]
+
+    @func_wrapper
+    def get_ledger_changes(self, version, db=None):
+        '''
+        Return the set of periods that changed after the version of the ledger change
+        counter.
+        '''
+        if db is None:
+            db = self.db
+        return set([x[0] for x in db.execute('SELECT DISTINCT period FROM LedgerChange WHERE version > ?;', (version,))])
+
+    @func_wrapper
+    def get_balance(self, account, date=None):
+        '''
+        Return the balance of the account at the end of the date (YYYY-MM-DD), or the
+        latest balance when no date is given, from the day rollups.
+        '''
+        if date is None:
+            date = '9999-12-31'
+        row = self.db.execute('SELECT balance FROM AccountDay WHERE account_ID = ? AND period <= ? '
+                        'ORDER BY period DESC LIMIT 1;', (account, date)).fetchone()
+        if row is None:
+            return 0.0
+        return row[0]
+
+    @func_wrapper
+    def get_balances(self, date=None):
+        '''
+        Return a dict of {account ID: balance} for all of the accounts at the end of
+        the date, or the latest balances when no date is given.
+        '''
+        if date is None:
+            date = '9999-12-31'
+        retv = dict([(x[0], 0.0) for x in self.db.execute('SELECT ID FROM Account;')])
+        for row in self.db.execute('SELECT d.account_ID, d.balance FROM AccountDay AS d '
+                        'WHERE d.period = (SELECT MAX(period) FROM AccountDay '
+                        'WHERE account_ID = d.account_ID AND period <= ?);', (date,)):
+            retv[row[0]] = row[1]
+        return retv
 
     @func_wrapper
     def update_row(self, table, rec, where):
@@ -311,6 +1404,7 @@ class Database(object):
         keys += '=?'
         vals = tuple(rec.values())
 
+        self._invalidate(table)
         sql = 'UPDATE %s SET %s WHERE %s;'%(table, keys, where)
         return self.db.execute(sql, vals)
 
@@ -320,26 +1414,25 @@ class Database(object):
         Update a row using a dictionary and the id of the row. This expects a dictionary where the keys are
         the column names and the data is the value to be placed in the columns.
         '''
-        keys = '=?,'.join(rec.keys())
-        keys += '=?'
-        vals = tuple(rec.values())
-
-        sql = 'UPDATE %s SET %s WHERE ID = %d;'%(table, keys, id)
-        return self.db.execute(sql, vals)
+        self._invalidate(table)
+        sql = self._statement('update', table, tuple(rec.keys()), ('ID',))
+        return self.db.execute(sql, tuple(rec.values()) + (id,))
 
     @func_wrapper
     def delete_row(self, table, id):
         '''
         Delete the row given by the ID
         '''
-        sql = 'DELETE FROM %s WHERE ID = %d;' % (table, id)
-        return self.db.execute(sql)
+        self._invalidate(table)
+        sql = self._statement('delete', table, where=('ID',))
+        return self.db.execute(sql, (id,))
 
     @func_wrapper
     def delete_where(self, table, where):
         '''
         Delete rows that conform to the "where" clause.
         '''
+        self._invalidate(table)
         sql = 'DELETE FROM %s WHERE %s;' % (table, where)
         return self.db.execute(sql)
 
@@ -348,16 +1441,33 @@ class Database(object):
         '''
         Return True if there is a row that has the column with the value
         '''
-        if type(value) is int or type(value) is float:
-            sql = 'SELECT %s FROM %s WHERE %s = %s;'%(column, table, column, str(value))
-        else:
-            sql = 'SELECT %s FROM %s WHERE %s = \"%s\";'%(column, table, column, value)
-        cursor = self.db.execute(sql)
+        sql = self._statement('exists', table, where=(column,))
+        cursor = self.db.execute(sql, (value,))
         if cursor.fetchone() is None:
             return False
 
         return True
 
+    @func_wrapper
+    def get_existing_values(self, table, column, values):
+        '''
+        Return the set of the values that already exist in the column of the table.
+        The values are loaded into a temporary table and matched with a single join
+        instead of one query per value.
+        '''
+        self.db.execute('DROP TABLE IF EXISTS temp.IncomingValues;')
+        self.db.execute('CREATE TEMP TABLE IncomingValues (value);')
+        self.db.executemany('INSERT INTO temp.IncomingValues (value) VALUES (?);',
+                            ((x,) for x in values))
+
+        sql = 'SELECT DISTINCT i.value FROM temp.IncomingValues AS i JOIN %s AS t ON t.%s = i.value;'%(table, column)
+        retv = set()
+        for row in self.db.execute(sql):
+            retv.add(row[0])
+
+        self.db.execute('DROP TABLE temp.IncomingValues;')
+        return retv
+
     @func_wrapper
     def convert_value(self, val, value_type, abs_val=True):
         '''
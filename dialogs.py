@@ -1,6 +1,7 @@
 import tkinter as tk
 import tkinter.ttk as ttk
 from tkinter.messagebox import showerror, askyesno
+from tkinter.filedialog import asksaveasfilename
 from database import Database
 from logger import *
 
@@ -12,11 +13,12 @@ class BaseDialog(tk.Toplevel):
     This class provides common services to simple data dialogs.
     '''
 
+    log_level = Logger.DEBUG
+
     def __init__(self, parent):
 
         tk.Toplevel.__init__(self, parent)
         self.transient(parent)
-        self.logger.set_level(Logger.DEBUG)
 
         self.parent = parent
 
@@ -90,13 +92,17 @@ class BaseDialog(tk.Toplevel):
 @class_wrapper
 class SelectItem(BaseDialog):
     '''
-    Create a list of items called 'name' from a table and return the database
-    ID of the item in item_id.
+    Search for an item called 'name' in a table and return the database ID of the
+    item in item_id. The list is searched as the user types and only shows the
+    first max_items matches.
     '''
 
+    log_level = Logger.DEBUG
+    max_items = 50      # number of matches shown
+    search_ms = 200     # delay after a key stroke before searching
+
     def __init__(self, master, table, column, thing=None):
 
-        self.logger.set_level(Logger.DEBUG)
         self.table = table
         self.column = column
         if thing is None:
@@ -105,6 +111,8 @@ class SelectItem(BaseDialog):
             self.thing = thing
 
         self.item_id = -1
+        self.items = []     # (ID, value) of the items in the list
+        self.search_job = None
         super().__init__(master)
         #self.wait_window(self)
 
@@ -121,33 +129,70 @@ class SelectItem(BaseDialog):
         tk.Label(frame, text="Select %s"%(self.thing), font=("Helvetica", 14)).grid(row=0, column=0, columnspan=2)
 
         ######################
-        # Populate the combo boxes
-        lst = self.data.populate_list(self.table, self.column)
-        lst.sort()
-
-        ######################
-        # Show the boxes
+        # Show the search entry and the list of matches
         tk.Label(frame, text='Name:').grid(row=1, column=0)
-        self.cbb = ttk.Combobox(frame, values=lst)
-        self.cbb.grid(row=1, column=1, padx=padx, pady=pady)
-        try:
-            self.cbb.current(0)
-        except tk.TclError:
+        self.text = tk.StringVar(self)
+        self.entry = tk.Entry(frame, textvariable=self.text, width=30)
+        self.entry.grid(row=1, column=1, padx=padx, pady=pady)
+        self.entry.bind('<Down>', self._focus_list)
+
+        self.lbox = tk.Listbox(frame, width=30, height=10, exportselection=False)
+        self.lbox.grid(row=2, column=1, padx=padx, pady=pady)
+        self.lbox.bind('<Double-1>', self.ok)
+
+        self.search()
+        if len(self.items) == 0:
             showerror("ERROR", "No records are available to select for this table.")
             self.cancel()
 
+        self.text.trace_add('write', self._text_changed)
+        return self.entry
+
+    @func_wrapper
+    def search(self):
+        '''
+        Fill the list with the items that match the text and select the first one.
+        '''
+        self.search_job = None
+        self.items = self.data.find_items(self.table, self.column, self.text.get(), self.max_items)
+
+        self.lbox.delete(0, tk.END)
+        for item in self.items:
+            self.lbox.insert(tk.END, item[1])
+        if len(self.items) > 0:
+            self.lbox.selection_set(0)
+
+    @func_wrapper
+    def _text_changed(self, *args):
+        '''
+        Search a little while after the last key stroke.
+        '''
+        if not self.search_job is None:
+            self.after_cancel(self.search_job)
+        self.search_job = self.after(self.search_ms, self.search)
+
+    @func_wrapper
+    def _focus_list(self, event=None):
+        self.lbox.focus_set()
+
     @func_wrapper
     def apply(self):
-        ''' Populate the form with the selected data. '''
-        id = self.data.get_id_by_name(self.table, self.column, self.cbb.get())
-        self.item_id = id
+        ''' Return the ID of the selected item. '''
+        if not self.search_job is None:
+            self.after_cancel(self.search_job)
+            self.search()
+
+        sel = self.lbox.curselection()
+        if len(sel) > 0:
+            self.item_id = self.items[sel[0]][0]
 
 @class_wrapper
 class EditDialog(BaseDialog):
 
+    log_level = Logger.DEBUG
+
     def __init__(self, master, table, column, row_id, thing=None):
 
-        self.logger.set_level(Logger.DEBUG)
         self.row_id = row_id
         self.table = table
         self.column = column
@@ -201,8 +246,8 @@ class EditDialog(BaseDialog):
         '''
         if askyesno("Confirm", "are you sure you want to save this %s?"%(self.thing)):
             value = self.widget.get(1.0, tk.END)
-            self.data.set_single_value(self.table, self.column, self.row_id, value)
-            self.data.commit()
+            with self.data.transaction('edit_dialog'):
+                self.data.set_single_value(self.table, self.column, self.row_id, value)
 
 
 ###############################################################################
@@ -245,3 +290,72 @@ class HelpDialog:
         self.tx.insert(tk.END, self.help_text)
         self.tx.config(state='disabled')
 
+
+@class_wrapper
+class ProfileDialog:
+    '''
+    Show the func_wrapper profile data and control profiling. The table is sorted
+    by total time. The export writes JSON, or CSV if the file name ends in .csv.
+    Starting profiling here covers every decorated method from then on, including
+    the callbacks that Tk was given before.
+    '''
+    columns = (('method', 'Method', 280), ('calls', 'Calls', 70), ('total', 'Total (s)', 90),
+                ('mean', 'Mean (ms)', 90), ('p95', 'p95 (ms)', 90), ('rows', 'Rows', 80))
+
+    def __init__(self, parent):
+        self.top = tk.Toplevel(parent)
+        self.top.title('Profile')
+
+        frame = tk.Frame(self.top)
+        self.tree = ttk.Treeview(frame, columns=[x[0] for x in self.columns], show='headings', height=20)
+        for name, text, width in self.columns:
+            self.tree.heading(name, text=text)
+            self.tree.column(name, width=width, anchor=tk.W if name == 'method' else tk.E)
+        self.sb = tk.Scrollbar(frame, command=self.tree.yview)
+        self.tree.config(yscrollcommand=self.sb.set)
+        self.sb.pack(side=tk.RIGHT, fill=tk.Y)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        frame.pack(fill=tk.BOTH, expand=True)
+
+        box = tk.Frame(self.top)
+        self.toggle_btn = tk.Button(box, width=15, command=self.toggle_cb)
+        self.toggle_btn.pack(side=tk.LEFT, padx=5, pady=5)
+        tk.Button(box, text='Refresh', width=10, command=self.refresh).pack(side=tk.LEFT, padx=5, pady=5)
+        tk.Button(box, text='Clear', width=10, command=self.clear_cb).pack(side=tk.LEFT, padx=5, pady=5)
+        tk.Button(box, text='Export', width=10, command=self.export_cb).pack(side=tk.LEFT, padx=5, pady=5)
+        tk.Button(box, text='Close', width=10, command=self.top.destroy).pack(side=tk.LEFT, padx=5, pady=5)
+        box.pack()
+
+        self.refresh()
+
+    @func_wrapper
+    def refresh(self):
+        '''
+        Reload the table from the profile data.
+        '''
+        if get_profiling():
+            self.toggle_btn.config(text='Stop Profiling')
+        else:
+            self.toggle_btn.config(text='Start Profiling')
+
+        self.tree.delete(*self.tree.get_children())
+        for rec in get_profile():
+            self.tree.insert('', tk.END, values=(rec['method'], rec['calls'], '%0.3f'%(rec['total']),
+                    '%0.3f'%(rec['mean']*1000), '%0.3f'%(rec['p95']*1000), rec['rows']))
+
+    @func_wrapper
+    def toggle_cb(self):
+        set_profiling(not get_profiling())
+        self.refresh()
+
+    @func_wrapper
+    def clear_cb(self):
+        clear_profile()
+        self.refresh()
+
+    @func_wrapper
+    def export_cb(self):
+        fname = asksaveasfilename(initialdir='.', title='Export Profile',
+                    filetypes=(('JSON files', '*.json'), ('CSV files', '*.csv'), ('all files', '*')))
+        if type(fname) is type('') and fname != '':
+            export_profile(fname)
@@ -19,15 +19,14 @@ class FormDialog(tk.Toplevel):
     not interact with the rest of the program except through the database.
     '''
 
+    log_level = Logger.DEBUG
+
     def __init__(self, owner, **kw):
 
         super().__init__(owner)
         self.transient(parent)
 
-        self.logger.set_level(Logger.DEBUG)
-
         self.owner = owner
-        self.logger.set_level(Logger.DEBUG)
         self.outer_frame = tk.Frame(self)
         self.frame = tk.Frame(self.outer_frame)
         self.frame.grid(row=0, column=0)
@@ -28,6 +28,8 @@ class FormWidgetBase(tk.Frame):
         self.widget = None
         self.label = None
         self.row_id = -1
+        # the value as it was loaded from the database, for change tracking
+        self.shown = None
 
     @func_wrapper
     def set_row_id(self, id):
@@ -51,6 +53,15 @@ class FormWidgetBase(tk.Frame):
         self.clear()
         pass
 
+    @func_wrapper
+    def set_row(self, row):
+        '''
+        Place the value into the widget from a row that the form has already read
+        from the database. The row is a dict of the columns of the form table. Widgets
+        that do not override this read their own value with setter().
+        '''
+        self.setter()
+
     @func_wrapper
     def clear(self):
         '''
@@ -58,6 +69,38 @@ class FormWidgetBase(tk.Frame):
         '''
         pass
 
+    @func_wrapper
+    def get_change(self):
+        '''
+        Return a dict of {column: value} when the value of the widget has changed
+        since it was loaded, or an empty dict when it has not. The form collects
+        these and writes all of the changes to a record with a single UPDATE.
+        '''
+        return {}
+
+    @func_wrapper
+    def current(self):
+        '''
+        Return the value of the widget in a form that can be compared to the value
+        that was loaded.
+        '''
+        return None
+
+    @func_wrapper
+    def is_dirty(self):
+        '''
+        Return True if the value of the widget was changed since it was loaded.
+        '''
+        return self.current() != self.shown
+
+    @func_wrapper
+    def mark_clean(self):
+        '''
+        Remember the value of the widget as the loaded value. Called after the value
+        is loaded or saved.
+        '''
+        self.shown = self.current()
+
     @func_wrapper
     def populate(self):
         '''
@@ -117,14 +160,32 @@ class FormEntry(FormWidgetBase):
         value = self._type(self.strvar.get())
         self.data.set_single_value(self.table, self.column, self.row_id, value)
 
+    @func_wrapper
+    def get_change(self):
+        if self.is_dirty():
+            return {self.column: self._type(self.strvar.get())}
+        return {}
+
+    @func_wrapper
+    def current(self):
+        return self.strvar.get()
+
     @func_wrapper
     def setter(self):
+        self._show(self.data.get_single_value(self.table, self.column, self.row_id))
+
+    @func_wrapper
+    def set_row(self, row):
+        self._show(row[self.column])
+
+    @func_wrapper
+    def _show(self, value):
         state = self.widget.configure()['state']
         if state == 'readonly':
             self.widget.configure(state='normal')
 
-        value = self.data.get_single_value(self.table, self.column, self.row_id)
         self.strvar.set(str(value))
+        self.mark_clean()
 
         if state == 'readonly':
             self.widget.configure(state='readonly')
@@ -192,12 +253,30 @@ class FormText(FormWidgetBase):
         value = self.widget.get(1.0, tk.END)
         self.data.set_single_value(self.table, self.column, self.row_id, value)
 
+    @func_wrapper
+    def get_change(self):
+        if self.is_dirty():
+            return {self.column: self.widget.get(1.0, tk.END)}
+        return {}
+
+    @func_wrapper
+    def current(self):
+        return self.widget.get(1.0, tk.END)
+
     @func_wrapper
     def setter(self):
-        value = self.data.get_single_value(self.table, self.column, self.row_id)
+        self._show(self.data.get_single_value(self.table, self.column, self.row_id))
+
+    @func_wrapper
+    def set_row(self, row):
+        self._show(row[self.column])
+
+    @func_wrapper
+    def _show(self, value):
         self.widget.delete('1.0', tk.END)
         if not value is None:
             self.widget.insert(tk.END, str(value))
+        self.mark_clean()
 
     @func_wrapper
     def clear(self):
@@ -249,11 +328,29 @@ class FormCombo(FormWidgetBase):
             value = self.widget.current()+1
             self.data.set_single_value(self.table, self.column, self.row_id, value)
 
+    @func_wrapper
+    def get_change(self):
+        if self.row_id != -1 and self.is_dirty():
+            return {self.column: self.widget.current()+1}
+        return {}
+
+    @func_wrapper
+    def current(self):
+        return self.widget.current()
+
     @func_wrapper
     def setter(self):
         if self.row_id != -1:
             value = self.data.get_single_value(self.table, self.column, self.row_id)
             self.widget.current(int(value)-1)
+            self.mark_clean()
+        self.populate()
+
+    @func_wrapper
+    def set_row(self, row):
+        if self.row_id != -1:
+            self.widget.current(int(row[self.column])-1)
+            self.mark_clean()
         self.populate()
 
     @func_wrapper
@@ -303,6 +400,10 @@ class FormDynamicLabel(FormWidgetBase):
         value = self.data.get_single_value(self.table, self.column, self.row_id)
         self.value.set(str(value))
 
+    @func_wrapper
+    def set_row(self, row):
+        self.value.set(str(row[self.column]))
+
 @class_wrapper
 class FormIndirectLabel(FormWidgetBase):
     '''
@@ -328,6 +429,8 @@ class FormIndirectLabel(FormWidgetBase):
         self.pop_column = pop_column
         self.table = table
         self.column = column
+        # Name of the display value in the row given to set_row(). Set by the form.
+        self.join_alias = None
 
         self.label = tk.Label(self, text=label+':', width=self.label_width)
         self.label.grid(row=0, column=0)
@@ -348,6 +451,17 @@ class FormIndirectLabel(FormWidgetBase):
         # set the value with the row_id
         self.data.set_single_value(self.table, self.column, self.row_id, id)
 
+    @func_wrapper
+    def get_change(self):
+        # The name only has to be looked up when it was changed.
+        if self.is_dirty():
+            return {self.column: self.data.get_id_by_row(self.pop_table, self.pop_column, self.value.get())}
+        return {}
+
+    @func_wrapper
+    def current(self):
+        return self.value.get()
+
     @func_wrapper
     def setter(self):
         # this is the ID
@@ -356,6 +470,24 @@ class FormIndirectLabel(FormWidgetBase):
         value = self.data.get_single_value(self.pop_table, self.pop_column, id)
         # set the widget value
         self.value.set(str(value))
+        self.mark_clean()
+
+    @func_wrapper
+    def set_row(self, row):
+        if self.join_alias is None:
+            self.setter()
+        else:
+            # the form joined the display value into the row
+            self.value.set(str(row[self.join_alias]))
+            self.mark_clean()
+
+    @func_wrapper
+    def get_join(self):
+        '''
+        Return the (column, pop_table, pop_column) that the form needs to join into
+        the row for this widget.
+        '''
+        return (self.column, self.pop_table, self.pop_column)
 
     @func_wrapper
     def clear(self):
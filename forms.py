@@ -6,6 +6,8 @@ from database import Database
 from form_widgets import *
 from form_dialog import *
 from dialogs import *
+from navigator import RowNavigator
+from browser import BrowseDialog
 from logger import *
 
 #
@@ -86,16 +88,17 @@ class Form(tk.Frame):
         self.btn_width = 10 # size of a button
         self.text_height = 20   # height of a text entry control
 
-        # row list management
+        # record navigation
         if not table is None:
-            self.row_list = self.data.get_id_list(self.table)
-            self.row_index = 0
+            self.rows = RowNavigator(self.table)
         else:
-            self.row_list = None
-            self.row_index = 0
+            self.rows = None
 
         # controls management
         self.ctl_list = []
+        self.joins = []     # display values joined into the row by load_form()
+        self.buttons = {}   # standard buttons by name
+        self.lock_column = None # Save and Delete are disabled when this is true
         self.grid()
 
     @func_wrapper
@@ -173,6 +176,8 @@ class Form(tk.Frame):
         **kw    =   Named args passed to the control
         '''
         ctrl = FormIndirectLabel(self.ctl_frame, label, pop_tab, pop_col, self.table, column, width=self._get_width(cols), **kw)
+        ctrl.join_alias = 'join%d'%(len(self.joins))
+        self.joins.append((ctrl.join_alias,) + ctrl.get_join())
         self._grid(ctrl, cols)
         self.ctl_list.append(ctrl)
 
@@ -220,7 +225,9 @@ class Form(tk.Frame):
             elif name == "Delete":
                 command = self._delete_button
             elif name == "Edit":
-                command = lambda x=self.row_list[self.row_index]: self._edit_button(x)
+                command = lambda: self._edit_button(self.rows.current())
+            elif name == "Browse":
+                command = self._browse_button
             elif name == "Select":
                 if column is None:
                     raise Exception("Select button requires a column to be specified.")
@@ -231,6 +238,7 @@ class Form(tk.Frame):
         ctrl = tk.Button(self.btn_frame, text=name, command=command, width=self.btn_width, **kw)
         ctrl.grid(row=self.btn_row, column=0, sticky='nw')
         self.btn_row += 1
+        self.buttons[name] = ctrl
 
     @func_wrapper
     def set_edit_class(self, cls):
@@ -249,16 +257,10 @@ class Form(tk.Frame):
         column  =   Column in the database where the data is located.
         **kw    =   Args passed to the button constructor
         '''
-        if len(self.row_list) == 0:
-            index = 0
-        else:
-            index = self.row_list[self.row_index]
-
         ctrl = tk.Button(self.btn_frame, text=name,
                         command=lambda t=self.table,
                                         c=column,
-                                        r=index,
-                                        l=thing: self._edit_btn_command(t, c, r, l),
+                                        l=thing: self._edit_btn_command(t, c, self.rows.current() or 0, l),
                         width=self.btn_width, **kw)
         ctrl.grid(row=self.btn_row, column=0, sticky='nw')
         self.btn_row += 1
@@ -277,29 +279,61 @@ class Form(tk.Frame):
         '''
         Load the form from the database.
         '''
-        if len(self.row_list) == 0:
+        row_id = self.rows.current()
+        if row_id is None:
             showinfo('Records', 'There are no records for this form to display.')
             return
 
+        # Read the whole record, including the display values of the indirect
+        # labels, in one query and hand it to the widgets.
+        row = self.data.get_row_with_joins(self.table, row_id, self.joins)
         for item in self.ctl_list:
-            item.set_row_id(self.row_list[self.row_index])
-            item.setter()
+            item.set_row_id(row_id)
+            if row is None:
+                item.clear()
+            else:
+                item.set_row(row)
+
+        # A committed record is in the ledger and can not be changed here.
+        locked = not row is None and not self.lock_column is None and bool(row[self.lock_column])
+        for name in ('Save', 'Delete'):
+            if name in self.buttons:
+                self.buttons[name].configure(state=tk.DISABLED if locked else tk.NORMAL)
 
         if self.scrolling:
             geom = self._get_geometry(self.ctl_frame)
             self.canvas.configure(scrollregion=(0, 0, geom['width'], geom['height']))
 
+    @func_wrapper
+    def show_record(self, row_id):
+        '''
+        Make the record with the ID current and load it into the form.
+        '''
+        self.rows.seek(row_id)
+        self.load_form()
+
     @func_wrapper
     def save_form(self):
         '''
-        Save the form to the database.
+        Save the form to the database. Only the columns that were changed are
+        written, with one UPDATE for the record. Nothing is written when nothing
+        was changed.
         TODO: Handle "new" forms.
         '''
+        row_id = self.rows.current()
+        rec = {}
         for item in self.ctl_list:
-            item.set_row_id(self.row_list[self.row_index])
-            item.getter()
+            item.set_row_id(row_id)
+            rec.update(item.get_change())
 
-        self.data.commit()
+        if len(rec) == 0:
+            return
+
+        with self.data.transaction('save_form'):
+            self.data.update_row_by_id(self.table, rec, row_id)
+
+        for item in self.ctl_list:
+            item.mark_clean()
 
     @func_wrapper
     def _get_geometry(self, wid):
@@ -351,32 +385,33 @@ class Form(tk.Frame):
 
     @func_wrapper
     def _next_button(self):
-        if not self.row_list is None:
-            self.row_index += 1
-            if self.row_index > len(self.row_list)-1:
-                self.row_index = len(self.row_list)-1
+        if not self.rows is None:
+            if self.rows.next() is None:
                 showinfo('Last Record', 'This is the last record.')
             else:
                 self.load_form()
 
     @func_wrapper
     def _prev_button(self):
-        if not self.row_list is None:
-            self.row_index -= 1
-            if self.row_index < 0:
-                self.row_index = 0
+        if not self.rows is None:
+            if self.rows.prev() is None:
                 showinfo('First Record', 'This is the first record.')
             else:
                 self.load_form()
 
     @func_wrapper
     def _select_button(self, column):
-        if not self.row_list is None:
+        if not self.rows is None:
             item = SelectItem(self, self.table, column)
             if item.item_id > 0:
-                self.row_index = self.row_list.index(item.item_id)
+                self.rows.seek(item.item_id)
                 self.load_form()
 
+    @func_wrapper
+    def _browse_button(self):
+        if not self.rows is None:
+            BrowseDialog(self, self.table, self.show_record)
+
     @func_wrapper
     def _new_button(self):
         for item in self.ctl_list:
@@ -385,17 +420,23 @@ class Form(tk.Frame):
     @func_wrapper
     def _save_button(self):
         if askyesno('Save record?', 'Are you sure you want to save this?'):
-            self.save_form()
+            try:
+                self.save_form()
+            except Exception as e:
+                showerror('Save', 'The record was not saved: %s'%(str(e)))
 
     @func_wrapper
     def _delete_button(self):
         if askyesno('Delete record?', 'Are you sure you want to delete this?'):
-            self.data.delete_row(self.table, self.row_list[self.row_index])
-            self.data.commit()
-
-            self.row_list = self.data.get_id_list(self.table)
-            if self.row_index > len(self.row_list):
-                self.row_index -= 1
+            row_id = self.rows.current()
+            try:
+                with self.data.transaction('delete_row'):
+                    self.data.delete_row(self.table, row_id)
+            except Exception as e:
+                showerror('Delete', 'The record was not deleted: %s'%(str(e)))
+                return
+
+            self.rows.remove(row_id)
             self.load_form()
 
     @func_wrapper
@@ -1,4 +1,5 @@
 
+import tkinter as tk
 from tkinter.messagebox import showwarning, showerror, showinfo
 import sys, os, csv
 from database import Database
@@ -11,13 +12,14 @@ class ImportPayPal(object):
     This class imports a PayPal CSV file into the database.
     '''
 
+    log_level = Logger.DEBUG
+
     def __init__(self, fname):
 
         self.fname = fname
         self.data = Database.get_instance()
         self.accepted = 0
         self.rejected = 0
-        self.logger.set_level(Logger.DEBUG)
 
         self.legend = [
             'Date',
@@ -69,34 +71,111 @@ class ImportPayPal(object):
         are private.
         '''
         # import the CSV file into the database.
+        self.data.push_profile('bulk-import')
         try:
-            self._read_file()
-            # get the various tables set up
-            codes = self._countries()
-            cust = self._customers()
-            vend = self._vendors()
-            sales = self._sales()
-            purch = self._purchases()
-
-            text = 'Imported records:\n'
-            text += '   %d country codes\n'%(codes)
-            text += '   %d unique customer entries\n'%(cust)
-            text += '   %d unique vendor entries\n'%(vend)
-            text += '   %d sale entries\n'%(sales)
-            text += '   %d purchase entries\n'%(purch)
-            text += '   %d CSV lines accepted\n'%(self.accepted)
-            text += '   %d CSV lines rejected\n'%(self.rejected)
-
-            showinfo('Import', text)
-
-        except Exception:
-            showerror("ERROR", 'Could not import file: "%s"'%(self.fname))
+            with self.data.transaction('import_all'):
+                self._load_static_ids()
+                self._read_file()
+                # get the various tables set up
+                codes = self._countries()
+                cust = self._customers()
+                vend = self._vendors()
+                sales = self._sales()
+                purch = self._purchases()
+                self.data.note_ledger_change()
+
+        except Exception as e:
+            self._notify('ERROR', 'Could not import file: "%s": %s'%(self.fname, str(e)), True)
+            return
+
+        finally:
+            self.data.pop_profile()
+
+        self._show_report(codes, cust, vend, sales, purch)
 
     @func_wrapper
-    def _read_file(self):
+    def import_stream(self):
+        '''
+        This is the single pass version of import_all(). Every CSV line is read
+        once. Each chunk of lines is checked against RawImport with one query, stored
+        in RawImport and then routed to the country, customer, vendor,
+        sale and purchase sinks. The RawImport flags are set in bulk after the
+        whole file has been read. The counts reported are the same as import_all().
+        '''
+        self.data.push_profile('bulk-import')
+        try:
+            with self.data.transaction('import_stream'):
+                self._open_sinks()
+                self.seen_ids = set()
+                batch = []
+                for rec in self._read_lines():
+                    if self._is_duplicate(rec):
+                        self.rejected += 1
+                        continue
+
+                    batch.append(rec)
+                    if len(batch) >= self.data.chunk_size:
+                        self._route_batch(self._drop_known(batch))
+                        batch = []
+
+                self._route_batch(self._drop_known(batch))
+                self._close_sinks()
+                # The uncommitted figures of the reports changed, but not the ledger.
+                self.data.note_ledger_change()
+
+        except Exception as e:
+            self._notify('ERROR', 'Could not import file: "%s": %s'%(self.fname, str(e)), True)
+            return
+
+        finally:
+            self.data.pop_profile()
+
+        self._show_report(self.counts['country'], self.counts['customer'],
+                          self.counts['vendor'], self.counts['sale'],
+                          self.counts['purchase'])
+
+    @func_wrapper
+    def _show_report(self, codes, cust, vend, sales, purch):
+        '''
+        Show the number of records that were imported into each table.
         '''
-        Read the CSV file into an array of lines where each one is a dictionary with the
-        column names as keys.
+        text = 'Imported records:\n'
+        text += '   %d country codes\n'%(codes)
+        text += '   %d unique customer entries\n'%(cust)
+        text += '   %d unique vendor entries\n'%(vend)
+        text += '   %d sale entries\n'%(sales)
+        text += '   %d purchase entries\n'%(purch)
+        text += '   %d CSV lines accepted\n'%(self.accepted)
+        text += '   %d CSV lines rejected\n'%(self.rejected)
+
+        text += '   %d statements in %0.1f seconds\n'%(self.data.last_transaction['statements'],
+                                                  self.data.last_transaction['seconds'])
+
+        self._notify('Import', text)
+
+    @func_wrapper
+    def _notify(self, title, text, error=False):
+        '''
+        Log the text and show it in a dialog. The dialog is only shown when there is
+        a Tk root window, so that the importer can also run without a display.
+        '''
+        if error:
+            self.logger.error(text)
+        else:
+            self.logger.msg(text)
+
+        if not tk._default_root is None:
+            if error:
+                if not self.logger.stream.has_window():
+                    showerror(title, text)
+            else:
+                showinfo(title, text)
+
+    @func_wrapper
+    def _read_lines(self):
+        '''
+        Generator that reads the CSV file and yields each line as a dictionary with
+        the column names as keys.
         '''
         with open(self.fname, "r") as fh:
             reader = csv.reader(fh)
@@ -122,32 +201,318 @@ class ImportPayPal(object):
                     rec['imported_sale'] = False
                     rec['imported_purchase'] = False
 
-                if not self.data.if_rec_exists('RawImport', 'TransactionID', rec['TransactionID']):
-                    self.data.insert_row('RawImport', rec)
-                    self.accepted += 1
-                else:
-                    self.rejected += 1
+                yield rec
+
+    @func_wrapper
+    def _read_file(self):
+        '''
+        Read the CSV file into the RawImport table, skipping the lines that have
+        already been imported.
+        '''
+        self.data.insert_rows('RawImport', self._accepted_lines())
+        self.data.commit()
+
+    @func_wrapper
+    def _accepted_lines(self):
+        '''
+        Generator that yields the lines of the file that are not duplicates and keeps
+        the accepted and rejected counts.
+        '''
+        self.seen_ids = set()
+        batch = []
+        for rec in self._read_lines():
+            if self._is_duplicate(rec):
+                self.rejected += 1
+                continue
+
+            batch.append(rec)
+            if len(batch) >= self.data.chunk_size:
+                yield from self._drop_known(batch)
+                batch = []
+
+        yield from self._drop_known(batch)
+
+    @func_wrapper
+    def _is_duplicate(self, rec):
+        '''
+        Return True if the line repeats a line that was already read from this file.
+        '''
+        tid = rec['TransactionID']
+        if tid in self.seen_ids:
+            return True
+
+        self.seen_ids.add(tid)
+        return False
+
+    @func_wrapper
+    def _drop_known(self, batch):
+        '''
+        Return the lines of the batch whose TransactionID is not in RawImport yet.
+        The whole batch is matched against the database with one query, so the file
+        is only read once.
+        '''
+        if len(batch) == 0:
+            return batch
+
+        known = self.data.get_existing_values('RawImport', 'TransactionID',
+                                [rec['TransactionID'] for rec in batch])
+        retv = [rec for rec in batch if not rec['TransactionID'] in known]
+        self.rejected += len(batch) - len(retv)
+        self.accepted += len(retv)
+        return retv
+
+    @func_wrapper
+    def _open_sinks(self):
+        '''
+        Load the name to ID maps and the static IDs that the streaming sinks use so
+        that routing a line does not need to query the database.
+        '''
+        self.countries = self.data.get_id_map('Country', 'abbreviation')
+        self.customers = self.data.get_id_map('Customer', 'name')
+        self.vendors = self.data.get_id_map('Vendor', 'name')
+        self._load_static_ids()
+
+        self.sales = []
+        self.purchases = []
+        self.counts = {'country':0, 'customer':0, 'vendor':0, 'sale':0, 'purchase':0}
+        self.flags = {'imported_country':[],
+                      'imported_customer':[],
+                      'imported_vendor':[],
+                      'imported_sale':[],
+                      'imported_purchase':[]}
+
+    @func_wrapper
+    def _load_static_ids(self):
+        '''
+        Look up the IDs of the static table rows that every imported record uses.
+        '''
+        self.static_ids = {
+            'email_primary': self.data.get_id_by_row('EmailStatus', 'name', 'primary'),
+            'phone_primary': self.data.get_id_by_row('PhoneStatus', 'name', 'primary'),
+            'class_retail': self.data.get_id_by_row('ContactClass', 'name', 'retail'),
+            'vendor_unknown': self.data.get_id_by_row('VendorType', 'name', 'unknown'),
+            'sale_complete': self.data.get_id_by_row('SaleStatus', 'name', 'complete'),
+            'purchase_complete': self.data.get_id_by_row('PurchaseStatus', 'name', 'complete'),
+            'purchase_unknown': self.data.get_id_by_row('PurchaseType', 'name', 'unknown')}
 
-            self.data.commit()
+    @func_wrapper
+    def _country_rec(self, item):
+        '''
+        Return the Country record of a RawImport line.
+        '''
+        return {'name': item['Country'],
+                'abbreviation': item['CountryCode']}
+
+    @func_wrapper
+    def _customer_rec(self, item, country_id):
+        '''
+        Return the Customer record of a RawImport line.
+        '''
+        return {'date_created': item['Date'],
+                'name': item['Name'],
+                'address1': item['AddressLine1'],
+                'address2': item['AddressLine2'],
+                'state': item['State'],
+                'city': item['City'],
+                'zip': item['PostalCode'],
+                'email_address': item['FromEmail'],
+                'email_status_ID': self.static_ids['email_primary'],
+                'phone_number': item['Phone'],
+                'phone_status_ID': self.static_ids['phone_primary'],
+                'description': 'Imported from PayPal',
+                'notes': item['Subject'],
+                'country_ID': country_id,
+                'class_ID': self.static_ids['class_retail']}
+
+    @func_wrapper
+    def _vendor_rec(self, item):
+        '''
+        Return the Vendor record of a RawImport line.
+        '''
+        return {'date_created': item['Date'],
+                'name': item['Name'],
+                'contact_name':'',
+                'email_address': item['ToEmail'],
+                'email_status_ID': self.static_ids['email_primary'],
+                'phone_number': '',
+                'phone_status_ID': self.static_ids['phone_primary'],
+                'description': item['ItemTitle'],
+                'notes': item['Subject'],
+                'type_ID': self.static_ids['vendor_unknown']}
+
+    @func_wrapper
+    def _sale_rec(self, item, customer_id):
+        '''
+        Return the SaleRecord record of a RawImport line.
+        '''
+        return {'date': item['Date'],
+                'customer_ID': customer_id,
+                'raw_import_ID': int(item['ID']),
+                'status_ID': self.static_ids['sale_complete'],
+                'transaction_uuid': item['TransactionID'],
+                'gross': self.data.convert_value(item['Gross'], float),
+                'fees': self.data.convert_value(item['Fee'], float),
+                'shipping': self.data.convert_value(item['Shipping'], float),
+                'notes': item['Subject'] + '\n' + item['ItemTitle'],
+                'committed': False}
+
+    @func_wrapper
+    def _purchase_rec(self, item, vendor_id):
+        '''
+        Return the PurchaseRecord record of a RawImport line.
+        '''
+        return {'date': item['Date'],
+                'raw_import_ID': int(item['ID']),
+                'vendor_ID': vendor_id,
+                'status_ID': self.static_ids['purchase_complete'],
+                'type_ID': self.static_ids['purchase_unknown'],
+                'transaction_uuid': item['TransactionID'],
+                'gross': self.data.convert_value(item['Gross'], float),
+                'tax': self.data.convert_value(item['SalesTax'], float),
+                'shipping': self.data.convert_value(item['Shipping'], float),
+                'notes': item['Subject'] + '\n' + item['ItemTitle'],
+                'committed': False}
+
+    @func_wrapper
+    def _close_sinks(self):
+        '''
+        Write the RawImport flags that the sinks collected, one UPDATE per chunk of
+        row IDs rather than one per row.
+        '''
+        for flag in self.flags:
+            self._set_flags(flag, self.flags[flag])
+
+    @func_wrapper
+    def _set_flags(self, flag, ids):
+        '''
+        Set an import flag on the RawImport rows with the given IDs, one UPDATE per
+        chunk of IDs.
+        '''
+        chunk = self.data.chunk_size
+        for idx in range(0, len(ids), chunk):
+            where = 'ID IN (%s)'%(','.join([str(x) for x in ids[idx:idx+chunk]]))
+            self.data.update_row('RawImport', {flag:True}, where)
+
+    @func_wrapper
+    def _route_batch(self, batch):
+        '''
+        Store a batch of accepted lines in RawImport and route each of them through
+        the sinks. The sale and purchase records that the batch produces are written
+        in bulk.
+        '''
+        ids = self.data.insert_rows('RawImport', batch)
+        for rec, row_id in zip(batch, ids):
+            rec['ID'] = row_id
+            self._route(rec)
+
+        self.data.insert_rows('SaleRecord', self.sales)
+        self.data.insert_rows('PurchaseRecord', self.purchases)
+        self.sales = []
+        self.purchases = []
+
+    @func_wrapper
+    def _route(self, item):
+        '''
+        Send a single RawImport line through all of the sinks. The order is the same
+        as the stages in import_all() because the later sinks depend on the earlier
+        ones.
+        '''
+        self._country_sink(item)
+        customer = self._customer_sink(item)
+        vendor = self._vendor_sink(item)
+        self._sale_sink(item, customer)
+        self._purchase_sink(item, vendor)
+
+    @func_wrapper
+    def _country_sink(self, item):
+        '''
+        Copy a new country code into the country codes table.
+        '''
+        if item['CountryCode'] != '' and not item['CountryCode'] in self.countries:
+            self.countries[item['CountryCode']] = self.data.insert_row('Country', self._country_rec(item))
+            self.counts['country'] += 1
+        self.flags['imported_country'].append(item['ID'])
+
+    @func_wrapper
+    def _customer_sink(self, item):
+        '''
+        Copy a new customer into the customer table. Returns True if the line was
+        accepted as a customer line.
+        '''
+        if item['BalanceImpact'] != 'Credit':
+            return False
+
+        if item['Type'] == 'Website Payment' or item['Type'] == 'General Payment':
+            if not item['Name'] in self.customers:
+                rec = self._customer_rec(item, self.countries.get(item['CountryCode']))
+                self.customers[item['Name']] = self.data.insert_row('Customer', rec)
+                self.counts['customer'] += 1
+            self.flags['imported_customer'].append(item['ID'])
+            return True
+
+        return False
+
+    @func_wrapper
+    def _vendor_sink(self, item):
+        '''
+        Copy a new vendor into the vendor table. Returns True if the line was
+        accepted as a vendor line. Like _vendors(), only the line that creates
+        the vendor is accepted.
+        '''
+        if item['BalanceImpact'] != 'Debit':
+            return False
+
+        if item['Name'] != '' and item['Name'] != 'PayPal':
+            if not item['Name'] in self.vendors:
+                self.vendors[item['Name']] = self.data.insert_row('Vendor', self._vendor_rec(item))
+                self.flags['imported_vendor'].append(item['ID'])
+                self.counts['vendor'] += 1
+                return True
+
+        return False
+
+    @func_wrapper
+    def _sale_sink(self, item, customer):
+        '''
+        Copy a credit line from a customer into the sales table.
+        '''
+        if not customer:
+            return
+
+        if item['Name'] != '' and item['Name'] != 'PayPal':
+            self.sales.append(self._sale_rec(item, self.customers[item['Name']]))
+            self.flags['imported_sale'].append(item['ID'])
+            self.counts['sale'] += 1
+
+    @func_wrapper
+    def _purchase_sink(self, item, vendor):
+        '''
+        Copy a debit line from a vendor into the purchase table.
+        '''
+        if not vendor:
+            return
+
+        self.purchases.append(self._purchase_rec(item, self.vendors[item['Name']]))
+        self.flags['imported_purchase'].append(item['ID'])
+        self.counts['purchase'] += 1
 
     @func_wrapper
     def _countries(self):
         '''
         Read the new import and copy new country codes into the country codes table.
         '''
-        data = self.data.get_row_list('RawImport', 'imported_country = false')
-        if data is None:
-            return 0
+        data = self.data.iter_row_list('RawImport', 'imported_country = false', 'row')
 
         count = 0
+        flags = []
         for item in data:
             if item['CountryCode'] != '' and not self.data.if_rec_exists('Country', 'abbreviation', item['CountryCode']):
-                rec = {'name': item['Country'],
-                        'abbreviation': item['CountryCode']}
-                self.data.insert_row('Country', rec)
+                self.data.insert_row('Country', self._country_rec(item))
                 count += 1
-            self.data.update_row_by_id('RawImport', {'imported_country':True}, item['ID'])
+            flags.append(item['ID'])
 
+        # RawImport is not written until the query over it is finished.
+        self._set_flags('imported_country', flags)
         self.data.commit()
         return count
 
@@ -156,37 +521,28 @@ class ImportPayPal(object):
         '''
         Find all of the new customer records and copy the data into the customers table.
         '''
-        data = self.data.get_row_list('RawImport', 'imported_customer = false and BalanceImpact = \'Credit\'')
-        if data is None:
-            showinfo('INFO', 'There are no customer contacts to import.')
-            return 0
+        data = self.data.iter_row_list('RawImport', 'imported_customer = false and BalanceImpact = \'Credit\'', 'row')
 
         count = 0
+        rows = 0
+        flags = []
         for item in data:
+            rows += 1
             if item['Type'] == 'Website Payment' or item['Type'] == 'General Payment':
                 # Yes it's a customer
                 if not self.data.if_rec_exists('Customer', 'name', item['Name']):
-                    rec = { 'date_created': item['Date'],
-                            'name': item['Name'],
-                            'address1': item['AddressLine1'],
-                            'address2': item['AddressLine2'],
-                            'state': item['State'],
-                            'city': item['City'],
-                            'zip': item['PostalCode'],
-                            'email_address': item['FromEmail'],
-                            'email_status_ID': self.data.get_id_by_row('EmailStatus', 'name', 'primary'),
-                            'phone_number': item['Phone'],
-                            'phone_status_ID': self.data.get_id_by_row('PhoneStatus', 'name', 'primary'),
-                            'description': 'Imported from PayPal',
-                            'notes': item['Subject'],
-                            'country_ID': self.data.get_id_by_row('Country', 'abbreviation', item['CountryCode']),
-                            'class_ID': self.data.get_id_by_row('ContactClass', 'name', 'retail')}
-
-                    self.data.insert_row('Customer', rec)
+                    country_id = self.data.get_id_by_row('Country', 'abbreviation', item['CountryCode'])
+                    self.data.insert_row('Customer', self._customer_rec(item, country_id))
                     count+=1
                 # BUG: (fixed) When there are multiple instances of a name, the sale or purch record does not get imported
                 # because the imported_customer field does not get updated due to the duplicate name interlock.
-                self.data.update_row_by_id('RawImport', {'imported_customer':True}, item['ID'])
+                flags.append(item['ID'])
+
+        if rows == 0:
+            self._notify('INFO', 'There are no customer contacts to import.')
+            return 0
+
+        self._set_flags('imported_customer', flags)
         self.data.commit()
         return count
 
@@ -195,30 +551,24 @@ class ImportPayPal(object):
         '''
         Find all of the new vendor records and copy the data into the vendor table.
         '''
-        data = self.data.get_row_list('RawImport', 'imported_vendor = false and BalanceImpact = \'Debit\'')
-        if data is None:
-            showinfo('INFO', 'There are no customer contacts to import.')
-            return 0
+        data = self.data.iter_row_list('RawImport', 'imported_vendor = false and BalanceImpact = \'Debit\'', 'row')
 
         count = 0
+        rows = 0
+        flags = []
         for item in data:
+            rows += 1
             if item['Name'] != '' and item['Name'] != 'PayPal':
                 if not self.data.if_rec_exists('Vendor', 'name', item['Name']):
-                    rec = { 'date_created': item['Date'],
-                            'name': item['Name'],
-                            'contact_name':'',
-                            'email_address': item['ToEmail'],
-                            'email_status_ID': self.data.get_id_by_row('EmailStatus', 'name', 'primary'),
-                            'phone_number': '',
-                            'phone_status_ID': self.data.get_id_by_row('PhoneStatus', 'name', 'primary'),
-                            'description': item['ItemTitle'],
-                            'notes': item['Subject'],
-                            'type_ID': self.data.get_id_by_row('VendorType', 'name', 'unknown'),}
-
-                    self.data.insert_row('Vendor', rec)
-                    self.data.update_row_by_id('RawImport', {'imported_vendor':True}, item['ID'])
+                    self.data.insert_row('Vendor', self._vendor_rec(item))
+                    flags.append(item['ID'])
                     count+=1
 
+        if rows == 0:
+            self._notify('INFO', 'There are no customer contacts to import.')
+            return 0
+
+        self._set_flags('imported_vendor', flags)
         self.data.commit()
         return count
 
@@ -227,29 +577,24 @@ class ImportPayPal(object):
         '''
         Find the sales records and copy the data into the sales database table.
         '''
-        data = self.data.get_row_list('RawImport', 'imported_sale = false and imported_customer = true and BalanceImpact = \'Credit\'')
-        if data is None:
-            showinfo('INFO', 'There are no sales transcations to import.')
-            return 0
+        data = self.data.iter_row_list('RawImport', 'imported_sale = false and imported_customer = true and BalanceImpact = \'Credit\'', 'row')
 
         count = 0
+        rows = 0
+        flags = []
         for item in data:
+            rows += 1
             if item['Name'] != '' and item['Name'] != 'PayPal':
-                rec = { 'date': item['Date'],
-                        'customer_ID': self.data.get_id_by_row('Customer', 'name', item['Name']),
-                        'raw_import_ID': int(item['ID']),
-                        'status_ID': self.data.get_id_by_row('SaleStatus', 'name', 'complete'),
-                        'transaction_uuid': item['TransactionID'],
-                        'gross': self.data.convert_value(item['Gross'], float),
-                        'fees': self.data.convert_value(item['Fee'], float),
-                        'shipping': self.data.convert_value(item['Shipping'], float),
-                        'notes': item['Subject'] + '\n' +item['ItemTitle'],
-                        'committed': False}
-
-                self.data.insert_row('SaleRecord', rec)
+                customer_id = self.data.get_id_by_row('Customer', 'name', item['Name'])
+                self.data.insert_row('SaleRecord', self._sale_rec(item, customer_id))
                 count+=1
-                self.data.update_row_by_id('RawImport', {'imported_sale':True}, item['ID'])
+                flags.append(item['ID'])
+
+        if rows == 0:
+            self._notify('INFO', 'There are no sales transcations to import.')
+            return 0
 
+        self._set_flags('imported_sale', flags)
         self.data.commit()
         return count
 
@@ -258,32 +603,23 @@ class ImportPayPal(object):
         '''
         Find all of the purchase records and copy the data into the purchase database table.
         '''
-        data = self.data.get_row_list('RawImport', 'imported_purchase = false and imported_vendor = true and BalanceImpact = \'Debit\'')
-        if data is None:
-            showinfo('INFO', 'There are no purchase transcations to import.')
-            return 0
+        data = self.data.iter_row_list('RawImport', 'imported_purchase = false and imported_vendor = true and BalanceImpact = \'Debit\'', 'row')
 
         count = 0
+        rows = 0
+        flags = []
         for item in data:
+            rows += 1
             if item['Name'] != '' and item['Name'] != 'PayPal':
-                gross = item['Gross']
-                tax = item['SalesTax']
-                shipping = item['Shipping']
-                rec = { 'date': item['Date'],
-                        'raw_import_ID': int(item['ID']),
-                        'vendor_ID': self.data.get_id_by_row('Vendor', 'name', item['Name']),
-                        'status_ID': self.data.get_id_by_row('PurchaseStatus', 'name', 'complete'),
-                        'type_ID': self.data.get_id_by_row('PurchaseType', 'name', 'unknown'),
-                        'transaction_uuid': item['TransactionID'],
-                        'gross': self.data.convert_value(item['Gross'], float),
-                        'tax': self.data.convert_value(item['SalesTax'], float),
-                        'shipping': self.data.convert_value(item['Shipping'], float),
-                        'notes': item['Subject'] + '\n' +item['ItemTitle'],
-                        'committed': False}
-
-                self.data.insert_row('PurchaseRecord', rec)
-                self.data.update_row_by_id('RawImport', {'imported_purchase':True}, item['ID'])
+                vendor_id = self.data.get_id_by_row('Vendor', 'name', item['Name'])
+                self.data.insert_row('PurchaseRecord', self._purchase_rec(item, vendor_id))
+                flags.append(item['ID'])
                 count+=1
 
+        if rows == 0:
+            self._notify('INFO', 'There are no purchase transcations to import.')
+            return 0
+
+        self._set_flags('imported_purchase', flags)
         self.data.commit()
         return count
@@ -1,5 +1,8 @@
 
-import sys, time
+import sys, os, time, atexit
+import csv, json, configparser
+import queue, threading
+from collections import deque
 import tkinter as tk
 from tkinter.messagebox import showerror
 from tkinter.filedialog import asksaveasfilename as get_filename
@@ -10,8 +13,14 @@ class _logger(tk.Toplevel): #(tk.Frame):
     This class is the base class that has the TK window that the logs go into. It is
     not intended to be inherited or used stand-alone. It is used by the Logger class
     to display the logs.
+
+    Messages are not written to the text control by the caller. They are queued in
+    a bounded buffer and a Tk timer moves them into the control in batches. The
+    control keeps at most max_lines lines and the oldest ones are dropped.
     '''
     _instance = None
+    max_lines = 5000    # lines kept in the buffer and in the text control
+    drain_ms = 100      # time between moving the buffer into the text control
 
     @staticmethod
     def get_instance():
@@ -66,6 +75,13 @@ class _logger(tk.Toplevel): #(tk.Frame):
         self.withdraw() # hidden by default
         self.enabled = False
 
+        # write() runs in the LogStream thread and flush() in the Tk thread, so the
+        # buffer and the dropped count are only touched under the lock.
+        self.lock = threading.Lock()
+        self.buffer = deque(maxlen=self.max_lines)
+        self.dropped = 0
+        self.after(self.drain_ms, self.drain)
+
     def destroy(self):
         '''
         Override the parent to prevent this from being destroyed with the system menu.
@@ -98,18 +114,52 @@ class _logger(tk.Toplevel): #(tk.Frame):
 
     def write(self, msg):
         '''
-        Add the message to the scrolling text control.
+        Queue the message for the scrolling text control. This never touches the
+        widget, so it does not wait for a redraw. When the buffer is full, the
+        oldest message is dropped.
         '''
-        self.text.configure(state='normal')
-        self.text.insert(tk.END, msg)
-        self.text.configure(state='disabled')
-        self.text.yview(tk.END) # Autoscroll to the bottom
+        with self.lock:
+            if len(self.buffer) == self.max_lines:
+                self.dropped += 1
+            self.buffer.append(msg)
+
+    def drain(self):
+        '''
+        Timer callback that moves the queued messages into the text control.
+        '''
+        self.flush()
+        self.after(self.drain_ms, self.drain)
+
+    def flush(self):
+        '''
+        Move the queued messages into the text control with a single insert, then
+        trim the control to max_lines.
+        '''
+        with self.lock:
+            buffer, self.buffer = self.buffer, deque(maxlen=self.max_lines)
+            dropped, self.dropped = self.dropped, 0
+
+        lines = []
+        if dropped > 0:
+            lines.append('--- %d log messages dropped ---\n'%(dropped))
+        lines.extend(buffer)
+
+        if len(lines) > 0:
+            self.text.configure(state='normal')
+            self.text.insert(tk.END, ''.join(lines))
+            count = int(self.text.index('end-1c').split('.')[0])
+            if count > self.max_lines:
+                self.text.delete('1.0', '%d.0'%(count - self.max_lines + 1))
+            self.text.configure(state='disabled')
+            if self.enabled:
+                self.text.yview(tk.END) # Autoscroll to the bottom
 
     def save_cb(self):
         '''
         Save button callback.
         '''
         result = get_filename(initialdir='.', title='Save Log File', filetypes=(('text files', '*.txt'), ('all files', '*')))
+        self.flush()
         txt = self.text.get(1.0, tk.END)
         with open(result, 'w') as fh:
             fh.write(txt)
@@ -118,6 +168,9 @@ class _logger(tk.Toplevel): #(tk.Frame):
         '''
         Clear button callback.
         '''
+        with self.lock:
+            self.buffer.clear()
+            self.dropped = 0
         self.text.configure(state='normal')
         self.text.delete('1.0', tk.END)
         self.text.configure(state='disabled')
@@ -130,6 +183,180 @@ class _logger(tk.Toplevel): #(tk.Frame):
         self.enabled = False
 
 
+class StderrSink(object):
+    '''
+    Log sink that writes the messages to stderr.
+    '''
+    def write(self, msg):
+        sys.stderr.write(msg)
+        sys.stderr.flush()
+
+
+class FileSink(object):
+    '''
+    Log sink that appends the messages to a file. When the file grows past
+    max_bytes it is renamed to fname.1, the older files are shifted up to
+    fname.<backups> and a new file is started.
+    '''
+    def __init__(self, fname, max_bytes=1048576, backups=3):
+        self.fname = fname
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.fh = open(self.fname, 'a')
+
+    def write(self, msg):
+        self.fh.write(msg)
+        self.fh.flush()
+        if self.fh.tell() >= self.max_bytes:
+            self.rotate()
+
+    def rotate(self):
+        '''
+        Close the current file, shift the backups and open a new file.
+        '''
+        self.fh.close()
+        if self.backups > 0:
+            for idx in range(self.backups-1, 0, -1):
+                src = '%s.%d'%(self.fname, idx)
+                if os.path.exists(src):
+                    os.replace(src, '%s.%d'%(self.fname, idx+1))
+            os.replace(self.fname, '%s.1'%(self.fname))
+        self.fh = open(self.fname, 'w')
+
+    def close(self):
+        self.fh.close()
+
+
+class MemorySink(object):
+    '''
+    Log sink that keeps the last max_lines messages in memory. Useful for tests
+    and for showing recent messages after the fact.
+    '''
+    def __init__(self, max_lines=1000):
+        self.lines = deque(maxlen=max_lines)
+
+    def write(self, msg):
+        self.lines.append(msg)
+
+    def get_lines(self):
+        '''
+        Return a list of the messages that are kept, oldest first.
+        '''
+        return list(self.lines)
+
+    def clear(self):
+        self.lines.clear()
+
+
+class LogStream(object):
+    '''
+    All of the Logger instances write into this singleton. A write only puts the
+    message on a queue and a background thread hands it to each of the sinks, so
+    a slow sink never holds up the caller. Nothing here needs Tk. The logger
+    window is one of the sinks and it is only created when open_window() is
+    called, so the Database and the importer can run without a display.
+    '''
+    _instance = None
+
+    @staticmethod
+    def get_instance():
+        '''
+        This class is a singleton. All classes using this should call get_instance(),
+        rather than instantiating it directly.
+        '''
+        if LogStream._instance is None:
+            LogStream()
+        return LogStream._instance
+
+    def __init__(self):
+
+        if LogStream._instance is None:
+            LogStream._instance = self
+        else:
+            raise Exception("LogStream class is a singleton. Use get_instance() instead.")
+
+        self.sinks = []
+        self.window = None
+
+        # ACCOUNTING_LOG is 'stderr' or the name of a log file
+        dest = os.environ.get('ACCOUNTING_LOG', '')
+        if dest == 'stderr':
+            self.add_sink(StderrSink())
+        elif dest != '':
+            self.add_sink(FileSink(dest))
+
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name='LogStream', daemon=True)
+        self.thread.start()
+        atexit.register(self.flush)
+
+    def _run(self):
+        '''
+        Background thread that writes the queued messages to the sinks.
+        '''
+        while True:
+            msg = self.queue.get()
+            for sink in list(self.sinks):
+                try:
+                    sink.write(msg)
+                except Exception:
+                    pass # a broken sink must not stop the others
+            self.queue.task_done()
+
+    def add_sink(self, sink):
+        '''
+        Add a sink. A sink is any object that has a write(msg) method.
+        '''
+        if not sink in self.sinks:
+            self.sinks.append(sink)
+
+    def remove_sink(self, sink):
+        '''
+        Remove a sink. Messages that are already queued may still reach it.
+        '''
+        if sink in self.sinks:
+            self.sinks.remove(sink)
+
+    def write(self, msg):
+        '''
+        Queue a message for the sinks.
+        '''
+        self.queue.put(msg)
+
+    def flush(self):
+        '''
+        Wait until all of the queued messages have been given to the sinks.
+        '''
+        self.queue.join()
+
+    def open_window(self):
+        '''
+        Create the logger window and add it as a sink. This requires a Tk root.
+        '''
+        if self.window is None:
+            self.window = _logger.get_instance()
+            self.add_sink(self.window)
+        return self.window
+
+    def has_window(self):
+        '''
+        Return True if the logger window exists.
+        '''
+        return not self.window is None
+
+    def is_visible(self):
+        '''
+        Return True if the logger window is showing.
+        '''
+        return self.has_window() and self.window.enabled
+
+    def toggle(self):
+        '''
+        Toggle the visibility of the logger window, creating it if needed.
+        '''
+        self.open_window().toggle()
+
+
 class Logger:
     '''
     Logger class produces messages on the text console. Used mostly for
@@ -167,13 +394,12 @@ class Logger:
         self.level.insert(0, level)
 
         # set the output location
-        self.stream = _logger.get_instance()
-        self.enabled = self.stream.enabled
+        self.stream = LogStream.get_instance()
 
     def toggle_visibility(self):
         '''
-        This must be called exactly one time to facilitate enabling and disabling
-        the window. It must be called before any text is written to the logger.
+        Show or hide the logger window. The window is created the first time
+        this is called if open_window() has not already created it.
         '''
         self.stream.toggle()
 
@@ -215,7 +441,8 @@ class Logger:
         '''
         val = self.fmt(args, 'ERROR')
         self.stream.write(val)
-        showerror("ERROR", val)
+        if self.stream.has_window():
+            showerror("ERROR", val)
 
 
     def msg(self, args):
@@ -233,7 +460,9 @@ class Logger:
         val = self.fmt(args, 'FATAL ERROR')
         self.stream.write(val)
         self.stream.write("System cannot continue\n\n")
-        showerror('FATAL ERROR', val)
+        self.stream.flush()
+        if self.stream.has_window():
+            showerror('FATAL ERROR', val)
         sys.exit(1)
 
     def push_level(self, level):
@@ -248,7 +477,7 @@ class Logger:
         Restores the logging level after a value has been pushed on to it.
         '''
         if len(self.level) > 1:
-            self.level.remove(0)
+            self.level.pop(0)
 
     def set_level(self, level):
         '''
@@ -264,32 +493,211 @@ class Logger:
             t = time.strftime("[%Y%m%d %H:%M:%S]")
             self.stream.write("%s %s: %s.%s(): %s\n"%(t, "DEBUG", self.name, name, args))
 
+# Every method decorated with func_wrapper checks these flags on each call, so
+# switching them reaches all of the calls, including the bound methods that Tk
+# already holds as callbacks. When both are off the check is the only cost.
+# Tracing is on when the ACCOUNTING_TRACE environment variable is set and
+# profiling when ACCOUNTING_PROFILE is set. set_tracing() and set_profiling()
+# switch them at runtime.
+_tracing = os.environ.get('ACCOUNTING_TRACE', '') != ''
+_profiling = os.environ.get('ACCOUNTING_PROFILE', '') != ''
+_active = _tracing or _profiling
+
+# Profile data, keyed by the qualified name of the method. The p95 is taken from
+# the most recent profile_samples calls.
+_profile = {}
+profile_samples = 1000
+
+def set_tracing(enabled):
+    '''
+    Turn the func_wrapper method tracing on or off for every decorated method.
+    '''
+    global _tracing, _active
+    _tracing = enabled
+    _active = _tracing or _profiling
+
+def get_tracing():
+    '''
+    Return True if method tracing is on.
+    '''
+    return _tracing
+
+def set_profiling(enabled):
+    '''
+    Turn the func_wrapper profiling on or off for every decorated method. The data
+    that has been gathered is kept until clear_profile() is called.
+    '''
+    global _profiling, _active
+    _profiling = enabled
+    _active = _tracing or _profiling
+
+def get_profiling():
+    '''
+    Return True if profiling is on.
+    '''
+    return _profiling
+
+def clear_profile():
+    '''
+    Throw away the profile data.
+    '''
+    _profile.clear()
+
+def _record(name, elapsed, retv):
+    '''
+    Add one call to the profile data. Rows are counted when the method returns a
+    list, tuple or set.
+    '''
+    if not name in _profile:
+        _profile[name] = {'calls':0, 'total':0.0, 'rows':0, 'samples':deque(maxlen=profile_samples)}
+
+    rec = _profile[name]
+    rec['calls'] += 1
+    rec['total'] += elapsed
+    rec['samples'].append(elapsed)
+    if isinstance(retv, (list, tuple, set)):
+        rec['rows'] += len(retv)
+
+def get_profile():
+    '''
+    Return a list of dicts, one per profiled method, with the number of calls, the
+    total, mean and p95 time in seconds and the number of rows returned. The list
+    is sorted by the total time, largest first.
+    '''
+    retv = []
+    for name, rec in list(_profile.items()):
+        samples = sorted(rec['samples'])
+        retv.append({
+            'method': name,
+            'calls': rec['calls'],
+            'total': rec['total'],
+            'mean': rec['total'] / rec['calls'],
+            'p95': samples[int(0.95 * (len(samples) - 1))],
+            'rows': rec['rows']})
+
+    retv.sort(key=lambda x: x['total'], reverse=True)
+    return retv
+
+def export_profile(fname):
+    '''
+    Write the profile data to a file. A name that ends in .csv gives CSV, otherwise
+    the data is written as JSON.
+    '''
+    data = get_profile()
+    with open(fname, 'w', newline='') as fh:
+        if fname.lower().endswith('.csv'):
+            writer = csv.DictWriter(fh, fieldnames=['method', 'calls', 'total', 'mean', 'p95', 'rows'])
+            writer.writeheader()
+            writer.writerows(data)
+        else:
+            json.dump({'time':time.strftime('%Y-%m-%d %H:%M:%S'), 'methods':data}, fh, indent=2)
+
 def func_wrapper(func):
     '''
-    This is a decorator used to decorate methods on a class for debugging.
+    This is a decorator used to decorate methods on a class for debugging. Nothing is
+    formatted unless the logger of the class is at the DEBUG level. The tracing and
+    profiling flags are checked on every call.
     '''
     def wrapper(*args, **kw):
 
-        args[0].logger.debugger(func.__name__, '--enter: %s %s'%(str(args), str(kw)))
+        logger = args[0].logger
+        if logger.level[0] > Logger.DEBUG:
+            return func(*args, **kw)
+
+        logger.debugger(func.__name__, '--enter: %s %s'%(str(args), str(kw)))
         retv = func(*args, **kw)
-        args[0].logger.debugger(func.__name__, '--returning: %s'%(str(retv)))
+        logger.debugger(func.__name__, '--returning: %s'%(str(retv)))
+
+        return retv
+
+    def profiled(*args, **kw):
+
+        start = time.perf_counter()
+        if _tracing:
+            retv = wrapper(*args, **kw)
+        else:
+            retv = func(*args, **kw)
+        _record(func.__qualname__, time.perf_counter() - start, retv)
 
         return retv
 
-    return wrapper
+    def switch(*args, **kw):
+
+        if not _active:
+            return func(*args, **kw)
+        elif _profiling:
+            return profiled(*args, **kw)
+        else:
+            return wrapper(*args, **kw)
+
+    switch.__name__ = func.__name__
+    switch.__qualname__ = func.__qualname__
+    switch.__doc__ = func.__doc__
+    switch.plain = func
+
+    return switch
+
+# Per-class logging levels. The file is an INI file with a [levels] section that
+# maps a class name, or "default", to a level name, e.g. "Database = INFO". A
+# level in the file overrides the log_level attribute of the class.
+log_config = os.environ.get('ACCOUNTING_LOG_CONFIG', 'logger.cfg')
+_levels = None
+
+def _load_levels():
+    '''
+    Read the level configuration file the first time it is needed.
+    '''
+    global _levels
+    if _levels is None:
+        _levels = {}
+        parser = configparser.ConfigParser()
+        parser.optionxform = str # class names are case sensitive
+        if parser.read(log_config) and parser.has_section('levels'):
+            for name, value in parser.items('levels'):
+                level = value.strip().upper()
+                if not hasattr(Logger, level):
+                    raise Exception("Unknown logging level %s for %s in %s"%(value, name, log_config))
+                _levels[name] = getattr(Logger, level)
+    return _levels
+
+def class_level(cl):
+    '''
+    Return the starting logging level of a decorated class.
+    '''
+    levels = _load_levels()
+    if cl.__name__ in levels:
+        return levels[cl.__name__]
+    elif 'default' in levels:
+        return levels['default']
+    else:
+        return getattr(cl, 'log_level', Logger.MESSAGE)
+
+def instance_logger(obj, level=None):
+    '''
+    Give one object its own logger so that its level can be changed without
+    changing the level for the rest of its class. The new logger starts at the
+    level of the class unless a level is given.
+    '''
+    if level is None:
+        level = obj.__class__.logger.level[0]
+    obj.logger = Logger(obj, level)
+    return obj.logger
 
 def class_wrapper(cl):
     '''
-    This decorator is for classes. It creates the logger and decorates the __init__
-    function by monkey patching it.
+    This decorator is for classes. It creates one logger that is shared by all of the
+    instances of the class and decorates the __init__ function by monkey patching it.
+    The level comes from the configuration file or the log_level class attribute.
     '''
+    cl.logger = Logger(cl.__name__, class_level(cl))
+
     orig_init = cl.__init__
     def new_init(self, *args, **kw):
-        self.logger = Logger(self)
-        self.logger.debugger('__init__', '-- enter %s %s'%(args, kw))
+        if self.logger.level[0] <= Logger.DEBUG:
+            self.logger.debugger('__init__', '-- enter %s %s'%(args, kw))
         orig_init(self, *args, **kw)
-        self.logger.debugger('__init__', '-- returning')
+        if self.logger.level[0] <= Logger.DEBUG:
+            self.logger.debugger('__init__', '-- returning')
 
     cl.__init__ = new_init
     return cl
-
@@ -1,17 +1,22 @@
 #!/usr/bin/env python3
-import sys
+import sys, time
+start_time = time.perf_counter()
 
 import tkinter as tk
 import tkinter.ttk as ttk
-from tkinter.messagebox import showinfo, askyesno, askokcancel
+from tkinter.messagebox import showinfo, showerror, askyesno, askokcancel
 from tkinter.filedialog import askopenfilename
+from tkinter.simpledialog import askstring
+from datetime import date, timedelta
 from database import Database
 
 from notebook import Notebook
 from setup_forms import *
 from main_forms import *
-from dialogs import HelpDialog
+from dialogs import HelpDialog, ProfileDialog
+from dashboard import Dashboard
 from importer import ImportPayPal
+from posting import Posting
 from logger import *
 
 @class_wrapper
@@ -38,28 +43,52 @@ class MainFrame(object):
         filemenu.add_command(label="Exit", command=self._confirm_exit)
         menubar.add_cascade(label="File", menu=filemenu)
 
+        actionmenu = tk.Menu(menubar, tearoff=0)
+        actionmenu.add_command(label="Commit Sales and Purchases", command=self._do_commit)
+        actionmenu.add_command(label="Rebuild Ledger Rollups", command=self._do_rebuild)
+        actionmenu.add_command(label="Close Books", command=self._do_close)
+        menubar.add_cascade(label="Actions", menu=actionmenu)
+
         # TODO: Add reports on menu. (see notes.txt)
 
         helpmenu = tk.Menu(menubar, tearoff=0)
         helpmenu.add_command(label="Help", command=self._do_help)
         helpmenu.add_command(label="Toggle Logging", command=self._do_logging)
+        helpmenu.add_command(label="Profile", command=self._do_profile)
         helpmenu.add_command(label="About", command=self._do_about)
         menubar.add_cascade(label="Help", menu=helpmenu)
 
         self.master.config(menu=menubar)
         self.master.protocol('WM_DELETE_WINDOW', self._confirm_exit)
 
-        # TODO: Show balance/P&L sheet on home tab.
+        # The forms are not built until their tab is shown.
+        self.dashboard = None
         nb1 = Notebook(self.master, ['Home', 'Customers', 'Vendors', 'Sales', 'Purchases', 'Setup'])
-        CustomersForm(nb1)
-        VendorsForm(nb1)
-        nb1.show_tab(0)
+        nb1.set_factory('Home', self._build_home)
+        nb1.set_factory('Customers', CustomersForm)
+        nb1.set_factory('Vendors', VendorsForm)
+        nb1.set_factory('Sales', sSalesForm)
+        nb1.set_factory('Purchases', sPurchaseForm)
 
         nb2 = Notebook(nb1.get_frame(nb1.get_tab_index('Setup')), ['Business', 'Accounts', 'Inventory'])
-        BusinessForm(nb2)
-        AccountsForm(nb2)
-        InventoryForm(nb2)
-        nb2.show_tab(0)
+        nb2.set_factory('Business', BusinessForm)
+        nb2.set_factory('Accounts', AccountsForm)
+        nb2.set_factory('Inventory', InventoryForm)
+        nb1.set_show_cb('Setup', lambda: nb2.show_tab(nb2.crnt_index))
+
+        nb1.show_tab(0)
+
+    @func_wrapper
+    def _build_home(self, notebook):
+        self.dashboard = Dashboard(notebook)
+
+    @func_wrapper
+    def _refresh_home(self):
+        '''
+        Update the dashboard after something changed the ledger.
+        '''
+        if not self.dashboard is None:
+            self.dashboard.refresh()
 
     def _confirm_exit(self):
         if askokcancel('Quit', 'Are you sure you want to quit?'):
@@ -70,7 +99,60 @@ class MainFrame(object):
         fname = askopenfilename(initialdir = '.', title = "Select file",filetypes = (("CSV files","*.CSV *.csv"),("all files","*")))
         if type(fname) is type(''):
             imp = ImportPayPal(fname)
-            imp.import_all()
+            imp.import_stream()
+            self._refresh_home()
+
+    @func_wrapper
+    def _do_commit(self):
+        post = Posting()
+        sales = post.get_uncommitted('SaleRecord')
+        purchases = post.get_uncommitted('PurchaseRecord')
+        if len(sales) + len(purchases) == 0:
+            showinfo('Commit', 'There are no uncommitted sales or purchases.')
+        elif askyesno('Commit?', 'Commit %d sales and %d purchases to the accounts?'%(len(sales), len(purchases))):
+            try:
+                counts = post.commit(sales, purchases)
+            except Exception as e:
+                showerror('Commit', 'Nothing was committed: %s'%(str(e)))
+                return
+            self._refresh_home()
+            stats = self.data.last_transaction
+            showinfo('Commit', 'Committed %d sales and %d purchases as %d transactions in %0.1f seconds.'%(
+                        counts['sales'], counts['purchases'], counts['legs'], stats['seconds']))
+
+    @func_wrapper
+    def _do_rebuild(self):
+        try:
+            report = self.data.rebuild_rollups()
+        except Exception as e:
+            showerror('Rebuild', 'The rollups were not rebuilt: %s'%(str(e)))
+            return
+        self._refresh_home()
+        lines = []
+        for table in self.data.rollups:
+            lines.append('%s: %d rows, %d drifted'%(table, report[table]['rows'], len(report[table]['drift'])))
+        for ID, period, total, balance in report['Account']['drift']:
+            lines.append('Account %d total is %0.2f but the ledger has %0.2f'%(ID, total, balance))
+        for line in lines:
+            self.logger.msg(line)
+        showinfo('Rebuild', '\n'.join(lines))
+
+    @func_wrapper
+    def _do_close(self):
+        # The default is the last day of the month before this one.
+        last = date.today().replace(day=1) - timedelta(days=1)
+        text = askstring('Close Books', 'Close the books through the date (YYYY-MM-DD):',
+                         initialvalue=last.isoformat(), parent=self.master)
+        if text is None:
+            return
+        if askyesno('Close Books?', 'Transactions through %s can not be changed after the books are closed. Close them?'%(text)):
+            try:
+                close = Posting().close_books(text)
+            except Exception as e:
+                showerror('Close Books', 'The books were not closed: %s'%(str(e)))
+                return
+            self._refresh_home()
+            showinfo('Close Books', 'The books are closed through %s.'%(close['date']))
 
     @func_wrapper
     def _do_help(self):
@@ -79,6 +161,12 @@ class MainFrame(object):
     @func_wrapper
     def _do_logging(self):
         self.logger.toggle_visibility()
+        # Method tracing is only worth its cost while the log can be seen.
+        set_tracing(self.logger.stream.is_visible())
+
+    @func_wrapper
+    def _do_profile(self):
+        ProfileDialog(self.master)
 
     @func_wrapper
     def _do_about(self):
@@ -113,7 +201,9 @@ if __name__ == "__main__":
     master.wm_title("Accounting")
 
     logger = Logger(__name__)
+    logger.stream.open_window()
     #logger.toggle_visibility() # logger is off by default
     logger.info("program start")
     MainFrame(master)#.main()
+    master.after_idle(lambda: logger.msg('cold start in %0.3f seconds'%(time.perf_counter() - start_time)))
     master.mainloop()
\ No newline at end of file
@@ -41,6 +41,7 @@ class CustomersForm(NotebookForm):
 
         self.add_std_button('Prev')
         self.add_std_button('Next')
+        self.add_std_button('Browse')
         self.add_button_spacer()
         self.add_std_button('Select', 'name')
         self.add_std_button('Clear')
@@ -83,6 +84,7 @@ class VendorsForm(NotebookForm):
 
         self.add_std_button('Prev')
         self.add_std_button('Next')
+        self.add_std_button('Browse')
         self.add_button_spacer()
         self.add_std_button('Select', 'name')
         self.add_std_button('Clear')
@@ -112,6 +114,7 @@ class sSalesForm(NotebookForm):
 
     def __init__(self, notebook):
         super().__init__(notebook, notebook.get_tab_index('Sales'), 'SaleRecord')
+        self.lock_column = 'committed'
 
         self.add_title('Sales Setup Form')
         self.add_indirect_label('Customer', 'customer_ID', 1, 'Customer', 'name')
@@ -128,6 +131,7 @@ class sSalesForm(NotebookForm):
 
         self.add_std_button('Prev')
         self.add_std_button('Next')
+        self.add_std_button('Browse')
         self.add_button_spacer()
         self.add_std_button('Save')
         self.add_std_button('Delete')
@@ -140,6 +144,7 @@ class sPurchaseForm(NotebookForm):
 
     def __init__(self, notebook):
         super().__init__(notebook, notebook.get_tab_index('Purchases'), 'PurchaseRecord')
+        self.lock_column = 'committed'
 
         self.add_title('Purchase Setup Form')
         self.add_indirect_label('Vendor', 'vendor_ID', 1, 'Vendor', 'name')
@@ -157,6 +162,7 @@ class sPurchaseForm(NotebookForm):
 
         self.add_std_button('Prev')
         self.add_std_button('Next')
+        self.add_std_button('Browse')
         self.add_button_spacer()
         self.add_std_button('Save')
         self.add_std_button('Delete')
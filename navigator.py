@@ -0,0 +1,109 @@
+from database import Database
+from logger import *
+
+@class_wrapper
+class RowNavigator(object):
+    '''
+    Move through the IDs of a table in order without loading all of them. A small
+    window of IDs around the current record is kept, and more are read with keyset
+    queries (WHERE ID > ? ORDER BY ID LIMIT n) when the window runs out. Nothing
+    is read until the navigator is first used.
+    '''
+
+    def __init__(self, table, window=20):
+        '''
+        table   =   The table to navigate.
+        window  =   Number of IDs to read at a time.
+        '''
+        self.data = Database.get_instance()
+        self.table = table
+        self.window = window
+        self.ids = None     # IDs around the current record, ascending
+        self.pos = 0        # index of the current record in self.ids
+
+    @func_wrapper
+    def current(self):
+        '''
+        Return the current ID, or None if the table is empty.
+        '''
+        if self.ids is None:
+            self.seek(0)
+
+        if len(self.ids) == 0:
+            return None
+        return self.ids[self.pos]
+
+    @func_wrapper
+    def next(self):
+        '''
+        Move to the next record and return its ID. Return None and stay where it
+        is when the current record is the last one.
+        '''
+        if self.current() is None:
+            return None
+
+        if self.pos + 1 >= len(self.ids):
+            more = self.data.get_ids_after(self.table, self.ids[-1], self.window)
+            if len(more) == 0:
+                return None
+            keep = self.ids[-self.window:]
+            self.ids = keep + more
+            self.pos = len(keep) - 1
+
+        self.pos += 1
+        return self.ids[self.pos]
+
+    @func_wrapper
+    def prev(self):
+        '''
+        Move to the previous record and return its ID. Return None and stay where
+        it is when the current record is the first one.
+        '''
+        if self.current() is None:
+            return None
+
+        if self.pos == 0:
+            more = self.data.get_ids_before(self.table, self.ids[0], self.window)
+            if len(more) == 0:
+                return None
+            self.ids = more + self.ids[:self.window]
+            self.pos = len(more)
+
+        self.pos -= 1
+        return self.ids[self.pos]
+
+    @func_wrapper
+    def seek(self, row_id):
+        '''
+        Make the record with the ID current and read the window around it. If the
+        ID does not exist, the next record becomes current, or the last one if
+        there is no next record.
+        '''
+        before = self.data.get_ids_before(self.table, row_id, self.window // 2)
+        after = self.data.get_ids_after(self.table, row_id - 1, self.window)
+        self.ids = before + after
+        if len(after) > 0:
+            self.pos = len(before)
+        else:
+            self.pos = max(len(before) - 1, 0)
+
+        return self.current()
+
+    @func_wrapper
+    def remove(self, row_id):
+        '''
+        Take a deleted ID out of the window. The record after it becomes current if
+        the deleted record was current. The database is read only when the window
+        has no record to move to.
+        '''
+        if self.ids is None:
+            return
+
+        if row_id in self.ids:
+            idx = self.ids.index(row_id)
+            del self.ids[idx]
+            if idx < self.pos:
+                self.pos -= 1
+
+        if self.pos >= len(self.ids):
+            self.seek(row_id)
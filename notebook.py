@@ -1,3 +1,4 @@
+import time
 import tkinter as tk
 import tkinter.ttk as ttk
 from logger import *
@@ -34,10 +35,11 @@ class Notebook(tk.Frame):
         self.grid()
 
     @func_wrapper
-    def add_tab(self, name, show_cb=None, hide_cb=None):
+    def add_tab(self, name, show_cb=None, hide_cb=None, factory=None):
         '''
         Add a tab to the notebook with the specified name. Creates a frame for the
-        tab and places it in the list, but does not display it.
+        tab and places it in the list, but does not display it. If a factory is
+        given, it is called with the notebook the first time the tab is shown.
         '''
         frame = tk.Frame(self)
         button = tk.Button(self.btn_frame, text=name, width=self.btn_width, relief='raised',
@@ -48,9 +50,44 @@ class Notebook(tk.Frame):
                                 'frame':frame,
                                 'button':button,
                                 'show_cb':show_cb,
-                                'hide_cb':hide_cb})
+                                'hide_cb':hide_cb,
+                                'factory':factory})
         self.frame_index += 1
 
+    @func_wrapper
+    def set_factory(self, name, factory):
+        '''
+        Set the factory of the named tab. The factory builds the contents of the
+        tab, normally a NotebookForm, and is not called until the tab is shown.
+        '''
+        index = self.get_tab_index(name)
+        if index < 0:
+            raise Exception("Notebook has no tab named %s"%(name))
+        self.frame_list[index]['factory'] = factory
+
+    @func_wrapper
+    def set_show_cb(self, name, cb):
+        '''
+        Set the callback of the named tab that is called every time the tab is
+        shown.
+        '''
+        index = self.get_tab_index(name)
+        if index < 0:
+            raise Exception("Notebook has no tab named %s"%(name))
+        self.frame_list[index]['show_cb'] = cb
+
+    @func_wrapper
+    def build_tab(self, index):
+        '''
+        Call the factory of the tab, if it has one that has not been called yet.
+        '''
+        factory = self.frame_list[index]['factory']
+        if not factory is None:
+            self.frame_list[index]['factory'] = None
+            start = time.perf_counter()
+            factory(self)
+            self.logger.msg('Built tab %s in %0.3f seconds'%(self.frame_list[index]['name'], time.perf_counter() - start))
+
     @func_wrapper
     def show_tab(self, index):
         '''
@@ -61,6 +98,7 @@ class Notebook(tk.Frame):
         if not self.frame_list[self.crnt_index]['hide_cb'] is None:
             self.frame_list[self.crnt_index]['hide_cb']()
 
+        self.build_tab(index)
         self.frame_list[index]['frame'].grid(row=1, column=0, sticky='sw')
         self.frame_list[index]['button'].configure(relief='sunken')
         if not self.frame_list[index]['show_cb'] is None:
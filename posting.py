@@ -0,0 +1,163 @@
+'''
+This module posts sales and purchases to the accounts. Posting a record is what
+"committing" it means: the record is split into legs in GenericTransaction, each
+leg is linked back to the record, the account totals and the ledger rollups are
+updated and the record is marked as committed. Committed amounts are not changed after that.
+'''
+
+import time
+from datetime import datetime
+from database import Database
+from logger import *
+
+@class_wrapper
+class Posting(object):
+    '''
+    Double entry posting engine. Each leg moves an amount from one account to
+    another. The from account total goes down and the to account total goes up by
+    the same amount, so the totals of all of the accounts always add up to zero.
+
+    A sale is posted as:
+        gross       Sales -> Cash
+        fee         Cash -> BankFees
+        shipping    ShippingCollected -> Sales
+    A purchase is posted as, where the expense account depends on the purchase type:
+        gross       Cash -> expense
+        tax         expense -> TaxesPayed
+        shipping    expense -> MaterialsShippingPayed
+    Legs with an amount of zero are not written.
+    '''
+
+    # Expense account of each purchase type.
+    expense_accounts = {'cogs':'Materials',
+                        'other':'OtherExpense',
+                        'owner':'OwnerCapital',
+                        'unknown':'ExpenseImport'}
+
+    def __init__(self):
+        self.data = Database.get_instance()
+
+    @func_wrapper
+    def get_uncommitted(self, table):
+        '''
+        Return a list of the IDs of the records in SaleRecord or PurchaseRecord that
+        have not been committed.
+        '''
+        return self.data.get_id_list(table, 'committed = false')
+
+    @func_wrapper
+    def commit(self, sale_ids=(), purchase_ids=()):
+        '''
+        Post the sales and purchases with the IDs in one transaction. Records that
+        are already committed are skipped. Either all of them are posted or, if
+        anything fails, none of them are.
+
+        Returns a dict with the number of sales, purchases and legs posted.
+        '''
+        self.accounts = self.data.get_id_map('Account', 'name')
+        types = self.data.get_id_map('PurchaseType', 'name')
+        self.types = dict([(ID, name) for name, ID in types.items()])
+        self.stamp = int(time.time())
+        self.closed = self.data.get_last_close()
+        self.totals = {}
+        self.rollups = {}
+
+        with self.data.transaction('commit_records'):
+            sales = self.data.get_rows_by_ids('SaleRecord', sale_ids, 'committed = false')
+            purchases = self.data.get_rows_by_ids('PurchaseRecord', purchase_ids, 'committed = false')
+
+            legs = self._post('SaleRecord', 'SGenericTransaction', 'sale_trans_ID', sales, self._sale_legs)
+            legs += self._post('PurchaseRecord', 'PGenericTransaction', 'purchase_trans_ID', purchases, self._purchase_legs)
+
+            self.data.add_to_column('Account', 'total', self.totals)
+            self.data.add_to_rollups(self.rollups)
+            if len(self.rollups) > 0:
+                self.data.note_ledger_change(set([date[:7] for account, date in self.rollups]))
+
+        retv = {'sales':len(sales), 'purchases':len(purchases), 'legs':legs}
+        self.logger.info('Committed %d sales and %d purchases as %d legs'%(retv['sales'], retv['purchases'], legs))
+        return retv
+
+    @func_wrapper
+    def _post(self, table, link_table, link_col, recs, leg_func):
+        '''
+        Write the legs and the link rows of the records and mark the records as
+        committed. The amounts are added to self.totals and self.rollups. Returns the
+        number of legs.
+        '''
+        legs = []
+        owners = []
+        for rec in recs:
+            date = self._iso_date(rec['date'])
+            if not self.closed is None and date <= self.closed['date']:
+                raise Exception('%s %d is dated %s and the books are closed through %s'%(
+                                table, rec['ID'], date, self.closed['date']))
+            for name, from_acct, to_acct, amount in leg_func(rec):
+                if amount == 0:
+                    continue
+                legs.append({'date_committed':self.stamp,
+                             'date':date,
+                             'gross':amount,
+                             'description':'%s %d %s'%(table, rec['ID'], name),
+                             'from_account_ID':self.accounts[from_acct],
+                             'to_account_ID':self.accounts[to_acct]})
+                owners.append(rec['ID'])
+                self._add_total(self.accounts[from_acct], date, -amount)
+                self._add_total(self.accounts[to_acct], date, amount)
+
+        ids = self.data.insert_rows('GenericTransaction', legs)
+        self.data.insert_rows(link_table, [{'generic_trans_ID':gid, link_col:rid} for gid, rid in zip(ids, owners)])
+        self.data.update_rows_by_id(table, [{'ID':rec['ID'], 'committed':True} for rec in recs])
+
+        return len(legs)
+
+    @func_wrapper
+    def close_books(self, date):
+        '''
+        Close the books through the date (YYYY-MM-DD). This fails if a sale or
+        purchase on or before the date is not committed, because it could never be
+        posted after the close.
+        '''
+        date = datetime.strptime(date, '%Y-%m-%d').strftime('%Y-%m-%d')
+        for table in ('SaleRecord', 'PurchaseRecord'):
+            for rec in self.data.iter_row_list(table, 'committed = false'):
+                if self._iso_date(rec['date']) <= date:
+                    raise Exception('%s %d is dated %s and is not committed'%(table, rec['ID'], rec['date']))
+
+        return self.data.close_books(date)
+
+    @func_wrapper
+    def _sale_legs(self, rec):
+        '''
+        Return the (name, from account, to account, amount) legs of a sale.
+        '''
+        return [('gross', 'Sales', 'Cash', abs(rec['gross'])),
+                ('fee', 'Cash', 'BankFees', abs(rec['fees'])),
+                ('shipping', 'ShippingCollected', 'Sales', abs(rec['shipping']))]
+
+    @func_wrapper
+    def _purchase_legs(self, rec):
+        '''
+        Return the (name, from account, to account, amount) legs of a purchase.
+        '''
+        expense = self.expense_accounts.get(self.types.get(rec['type_ID']), 'ExpenseImport')
+        return [('gross', 'Cash', expense, abs(rec['gross'])),
+                ('tax', expense, 'TaxesPayed', abs(rec['tax'] or 0)),
+                ('shipping', expense, 'MaterialsShippingPayed', abs(rec['shipping'] or 0))]
+
+    @func_wrapper
+    def _add_total(self, account, date, amount):
+        self.totals[account] = round(self.totals.get(account, 0.0) + amount, 2)
+        key = (account, date)
+        self.rollups[key] = round(self.rollups.get(key, 0.0) + amount, 2)
+
+    @func_wrapper
+    def _iso_date(self, text):
+        '''
+        Convert a PayPal date (M/D/YYYY) to YYYY-MM-DD. Dates that are already in
+        that form are kept.
+        '''
+        try:
+            return datetime.strptime(text, '%m/%d/%Y').strftime('%Y-%m-%d')
+        except ValueError:
+            return datetime.strptime(text[:10], '%Y-%m-%d').strftime('%Y-%m-%d')
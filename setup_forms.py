@@ -43,7 +43,8 @@ class AccountsForm(NotebookForm):
         self.add_entry('Name', 'name', 1, str)
         self.add_entry('Number', 'number', 1, str)
         self.add_combo('Type', 'type_ID', 1, 'AccountTypes', 'name')
-        self.add_entry('Total', 'total', 1, float)
+        # The total is kept by posting, see Database.rebuild_rollups().
+        self.add_dynamic_label('Total', 'total', 1)
         self.add_entry('Description', 'description', 2, str)
 
         self.add_std_button('Prev')
@@ -0,0 +1,51 @@
+###############################################################################
+#
+# Migration 1: Indexes for the lookups that the forms and the importer use.
+#
+
+###############################################################################
+# A PayPal transaction can only be imported one time. Older importers could
+# store a TransactionID more than once, and lines without one, so the index
+# cannot simply be unique. A repeated TransactionID is kept on the first row
+# and the later rows get a hash sign and their ID appended to theirs. Their IDs
+# and TransactionIDs are recorded in RawImportDuplicate. Lines with an empty
+# TransactionID are left out of the unique index. Databases opened by earlier
+# versions may already have a unique index with this name.
+DROP INDEX IF EXISTS RawImportTransactionID;
+
+CREATE TABLE RawImportDuplicate AS
+    SELECT r.ID, r.TransactionID FROM RawImport AS r
+    WHERE r.TransactionID != '' AND EXISTS (SELECT 1 FROM RawImport AS o
+        WHERE o.TransactionID = r.TransactionID AND o.ID < r.ID);
+
+UPDATE RawImport SET TransactionID = TransactionID || char(35) || ID   # a hash sign would start a comment
+    WHERE ID IN (SELECT ID FROM RawImportDuplicate);
+
+CREATE INDEX RawImportTransactionID ON RawImport (TransactionID);
+CREATE UNIQUE INDEX RawImportTransactionIDUnique ON RawImport (TransactionID)
+        WHERE TransactionID != '';
+
+###############################################################################
+# Contacts are matched by name when importing and selecting.
+CREATE INDEX CustomerName ON Customer (name);
+CREATE INDEX VendorName ON Vendor (name);
+CREATE INDEX CountryAbbreviation ON Country (abbreviation);
+
+###############################################################################
+# Sales and purchases are found by their customer or vendor.
+CREATE INDEX SaleRecordCustomer ON SaleRecord (customer_ID);
+CREATE INDEX PurchaseRecordVendor ON PurchaseRecord (vendor_ID);
+
+###############################################################################
+# The importer only looks at the lines that have not been imported yet. These
+# partial indexes only hold those lines, so they stay small.
+CREATE INDEX RawImportNewCountry ON RawImport (ID)
+        WHERE imported_country = false;
+CREATE INDEX RawImportNewCustomer ON RawImport (BalanceImpact)
+        WHERE imported_customer = false;
+CREATE INDEX RawImportNewVendor ON RawImport (BalanceImpact)
+        WHERE imported_vendor = false;
+CREATE INDEX RawImportNewSale ON RawImport (BalanceImpact)
+        WHERE imported_sale = false;
+CREATE INDEX RawImportNewPurchase ON RawImport (BalanceImpact)
+        WHERE imported_purchase = false;
@@ -0,0 +1,9 @@
+###############################################################################
+#
+# Migration 2: Indexes for the record browsers. The browsers sort and page sales
+# and purchases by date, so the pages are read from the index instead of being
+# sorted from the whole table.
+#
+
+CREATE INDEX SaleRecordDate ON SaleRecord (date);
+CREATE INDEX PurchaseRecordDate ON PurchaseRecord (date);
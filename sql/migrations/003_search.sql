@@ -0,0 +1,127 @@
+###############################################################################
+#
+# Migration 3: Full text search. Each searched table has an external content
+# FTS5 table, so the text is not stored twice, and triggers that keep it in
+# step with the table. Rows where all of the searched columns are empty, like
+# most imported sales, are not indexed. The update triggers only fire when a
+# searched column is changed, so the importer flag updates on RawImport do not
+# touch the index.
+#
+# Database.insert_rows() sets SearchSync.bulk while it writes a chunk and then
+# indexes the whole chunk with one statement, which is much faster than the
+# insert trigger doing it one row at a time. The flag is only set inside of the
+# writing transaction, so other connections always see it as 0.
+#
+
+CREATE TABLE SearchSync (bulk INTEGER NOT NULL);
+INSERT INTO SearchSync (bulk) VALUES (0);
+
+###############################################################################
+CREATE VIRTUAL TABLE CustomerSearch USING fts5(name, email_address, notes, content='Customer', content_rowid='ID');
+
+CREATE TRIGGER CustomerSearchInsert AFTER INSERT ON Customer WHEN (SELECT bulk FROM SearchSync) = 0 AND IFNULL(new.name, '') || IFNULL(new.email_address, '') || IFNULL(new.notes, '') != '' BEGIN
+        INSERT INTO CustomerSearch (rowid, name, email_address, notes) VALUES (new.ID, new.name, new.email_address, new.notes);
+END;
+
+CREATE TRIGGER CustomerSearchDelete AFTER DELETE ON Customer WHEN IFNULL(old.name, '') || IFNULL(old.email_address, '') || IFNULL(old.notes, '') != '' BEGIN
+        INSERT INTO CustomerSearch (CustomerSearch, rowid, name, email_address, notes) VALUES ('delete', old.ID, old.name, old.email_address, old.notes);
+END;
+
+CREATE TRIGGER CustomerSearchUpdateOld BEFORE UPDATE OF name, email_address, notes ON Customer WHEN IFNULL(old.name, '') || IFNULL(old.email_address, '') || IFNULL(old.notes, '') != '' BEGIN
+        INSERT INTO CustomerSearch (CustomerSearch, rowid, name, email_address, notes) VALUES ('delete', old.ID, old.name, old.email_address, old.notes);
+END;
+
+CREATE TRIGGER CustomerSearchUpdateNew AFTER UPDATE OF name, email_address, notes ON Customer WHEN IFNULL(new.name, '') || IFNULL(new.email_address, '') || IFNULL(new.notes, '') != '' BEGIN
+        INSERT INTO CustomerSearch (rowid, name, email_address, notes) VALUES (new.ID, new.name, new.email_address, new.notes);
+END;
+
+# Index the rows that are already there.
+INSERT INTO CustomerSearch (rowid, name, email_address, notes) SELECT ID, name, email_address, notes FROM Customer WHERE IFNULL(name, '') || IFNULL(email_address, '') || IFNULL(notes, '') != '';
+
+###############################################################################
+CREATE VIRTUAL TABLE VendorSearch USING fts5(name, email_address, notes, content='Vendor', content_rowid='ID');
+
+CREATE TRIGGER VendorSearchInsert AFTER INSERT ON Vendor WHEN (SELECT bulk FROM SearchSync) = 0 AND IFNULL(new.name, '') || IFNULL(new.email_address, '') || IFNULL(new.notes, '') != '' BEGIN
+        INSERT INTO VendorSearch (rowid, name, email_address, notes) VALUES (new.ID, new.name, new.email_address, new.notes);
+END;
+
+CREATE TRIGGER VendorSearchDelete AFTER DELETE ON Vendor WHEN IFNULL(old.name, '') || IFNULL(old.email_address, '') || IFNULL(old.notes, '') != '' BEGIN
+        INSERT INTO VendorSearch (VendorSearch, rowid, name, email_address, notes) VALUES ('delete', old.ID, old.name, old.email_address, old.notes);
+END;
+
+CREATE TRIGGER VendorSearchUpdateOld BEFORE UPDATE OF name, email_address, notes ON Vendor WHEN IFNULL(old.name, '') || IFNULL(old.email_address, '') || IFNULL(old.notes, '') != '' BEGIN
+        INSERT INTO VendorSearch (VendorSearch, rowid, name, email_address, notes) VALUES ('delete', old.ID, old.name, old.email_address, old.notes);
+END;
+
+CREATE TRIGGER VendorSearchUpdateNew AFTER UPDATE OF name, email_address, notes ON Vendor WHEN IFNULL(new.name, '') || IFNULL(new.email_address, '') || IFNULL(new.notes, '') != '' BEGIN
+        INSERT INTO VendorSearch (rowid, name, email_address, notes) VALUES (new.ID, new.name, new.email_address, new.notes);
+END;
+
+# Index the rows that are already there.
+INSERT INTO VendorSearch (rowid, name, email_address, notes) SELECT ID, name, email_address, notes FROM Vendor WHERE IFNULL(name, '') || IFNULL(email_address, '') || IFNULL(notes, '') != '';
+
+###############################################################################
+CREATE VIRTUAL TABLE SaleRecordSearch USING fts5(notes, content='SaleRecord', content_rowid='ID');
+
+CREATE TRIGGER SaleRecordSearchInsert AFTER INSERT ON SaleRecord WHEN (SELECT bulk FROM SearchSync) = 0 AND IFNULL(new.notes, '') != '' BEGIN
+        INSERT INTO SaleRecordSearch (rowid, notes) VALUES (new.ID, new.notes);
+END;
+
+CREATE TRIGGER SaleRecordSearchDelete AFTER DELETE ON SaleRecord WHEN IFNULL(old.notes, '') != '' BEGIN
+        INSERT INTO SaleRecordSearch (SaleRecordSearch, rowid, notes) VALUES ('delete', old.ID, old.notes);
+END;
+
+CREATE TRIGGER SaleRecordSearchUpdateOld BEFORE UPDATE OF notes ON SaleRecord WHEN IFNULL(old.notes, '') != '' BEGIN
+        INSERT INTO SaleRecordSearch (SaleRecordSearch, rowid, notes) VALUES ('delete', old.ID, old.notes);
+END;
+
+CREATE TRIGGER SaleRecordSearchUpdateNew AFTER UPDATE OF notes ON SaleRecord WHEN IFNULL(new.notes, '') != '' BEGIN
+        INSERT INTO SaleRecordSearch (rowid, notes) VALUES (new.ID, new.notes);
+END;
+
+# Index the rows that are already there.
+INSERT INTO SaleRecordSearch (rowid, notes) SELECT ID, notes FROM SaleRecord WHERE IFNULL(notes, '') != '';
+
+###############################################################################
+CREATE VIRTUAL TABLE PurchaseRecordSearch USING fts5(notes, content='PurchaseRecord', content_rowid='ID');
+
+CREATE TRIGGER PurchaseRecordSearchInsert AFTER INSERT ON PurchaseRecord WHEN (SELECT bulk FROM SearchSync) = 0 AND IFNULL(new.notes, '') != '' BEGIN
+        INSERT INTO PurchaseRecordSearch (rowid, notes) VALUES (new.ID, new.notes);
+END;
+
+CREATE TRIGGER PurchaseRecordSearchDelete AFTER DELETE ON PurchaseRecord WHEN IFNULL(old.notes, '') != '' BEGIN
+        INSERT INTO PurchaseRecordSearch (PurchaseRecordSearch, rowid, notes) VALUES ('delete', old.ID, old.notes);
+END;
+
+CREATE TRIGGER PurchaseRecordSearchUpdateOld BEFORE UPDATE OF notes ON PurchaseRecord WHEN IFNULL(old.notes, '') != '' BEGIN
+        INSERT INTO PurchaseRecordSearch (PurchaseRecordSearch, rowid, notes) VALUES ('delete', old.ID, old.notes);
+END;
+
+CREATE TRIGGER PurchaseRecordSearchUpdateNew AFTER UPDATE OF notes ON PurchaseRecord WHEN IFNULL(new.notes, '') != '' BEGIN
+        INSERT INTO PurchaseRecordSearch (rowid, notes) VALUES (new.ID, new.notes);
+END;
+
+# Index the rows that are already there.
+INSERT INTO PurchaseRecordSearch (rowid, notes) SELECT ID, notes FROM PurchaseRecord WHERE IFNULL(notes, '') != '';
+
+###############################################################################
+CREATE VIRTUAL TABLE RawImportSearch USING fts5(ItemTitle, Subject, content='RawImport', content_rowid='ID');
+
+CREATE TRIGGER RawImportSearchInsert AFTER INSERT ON RawImport WHEN (SELECT bulk FROM SearchSync) = 0 AND IFNULL(new.ItemTitle, '') || IFNULL(new.Subject, '') != '' BEGIN
+        INSERT INTO RawImportSearch (rowid, ItemTitle, Subject) VALUES (new.ID, new.ItemTitle, new.Subject);
+END;
+
+CREATE TRIGGER RawImportSearchDelete AFTER DELETE ON RawImport WHEN IFNULL(old.ItemTitle, '') || IFNULL(old.Subject, '') != '' BEGIN
+        INSERT INTO RawImportSearch (RawImportSearch, rowid, ItemTitle, Subject) VALUES ('delete', old.ID, old.ItemTitle, old.Subject);
+END;
+
+CREATE TRIGGER RawImportSearchUpdateOld BEFORE UPDATE OF ItemTitle, Subject ON RawImport WHEN IFNULL(old.ItemTitle, '') || IFNULL(old.Subject, '') != '' BEGIN
+        INSERT INTO RawImportSearch (RawImportSearch, rowid, ItemTitle, Subject) VALUES ('delete', old.ID, old.ItemTitle, old.Subject);
+END;
+
+CREATE TRIGGER RawImportSearchUpdateNew AFTER UPDATE OF ItemTitle, Subject ON RawImport WHEN IFNULL(new.ItemTitle, '') || IFNULL(new.Subject, '') != '' BEGIN
+        INSERT INTO RawImportSearch (rowid, ItemTitle, Subject) VALUES (new.ID, new.ItemTitle, new.Subject);
+END;
+
+# Index the rows that are already there.
+INSERT INTO RawImportSearch (rowid, ItemTitle, Subject) SELECT ID, ItemTitle, Subject FROM RawImport WHERE IFNULL(ItemTitle, '') || IFNULL(Subject, '') != '';
@@ -0,0 +1,24 @@
+###############################################################################
+#
+# Migration 4: Posting sales and purchases to the accounts.
+#
+
+###############################################################################
+# The date of the sale or purchase that a leg was posted from, as YYYY-MM-DD,
+# so that the ledger can be reported by period.
+ALTER TABLE GenericTransaction ADD COLUMN date TEXT;
+CREATE INDEX GenericTransactionDate ON GenericTransaction (date);
+
+###############################################################################
+# Sales income. The gross of a sale moves from here into Cash.
+INSERT INTO Account
+        (number, name, description, type_ID, total)
+    VALUES
+        (3001, 'Sales', 'Income from sales.', 1, 0.0);
+
+###############################################################################
+# Find the legs of a sale or purchase, and the records that are not posted yet.
+CREATE INDEX SGenericTransactionSale ON SGenericTransaction (sale_trans_ID);
+CREATE INDEX PGenericTransactionPurchase ON PGenericTransaction (purchase_trans_ID);
+CREATE INDEX SaleRecordUncommitted ON SaleRecord (ID) WHERE committed = false;
+CREATE INDEX PurchaseRecordUncommitted ON PurchaseRecord (ID) WHERE committed = false;
@@ -0,0 +1,22 @@
+###############################################################################
+#
+# Migration 5: Ledger rollups. For each account and each day or month with
+# postings, amount is the net change in the period and balance is the balance
+# at the end of it. The balance on any date is then the balance of the last
+# period on or before it, which is one index lookup. Posting keeps them up to
+# date and Database.rebuild_rollups() recomputes them from GenericTransaction.
+#
+
+CREATE TABLE AccountDay
+        (account_ID INTEGER NOT NULL,
+        period TEXT NOT NULL,   # YYYY-MM-DD
+        amount REAL NOT NULL,
+        balance REAL NOT NULL,
+        PRIMARY KEY (account_ID, period)) WITHOUT ROWID;
+
+CREATE TABLE AccountMonth
+        (account_ID INTEGER NOT NULL,
+        period TEXT NOT NULL,   # YYYY-MM
+        amount REAL NOT NULL,
+        balance REAL NOT NULL,
+        PRIMARY KEY (account_ID, period)) WITHOUT ROWID;
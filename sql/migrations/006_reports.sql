@@ -0,0 +1,24 @@
+###############################################################################
+#
+# Migration 6: Report support. Each account gets the section of the balance
+# sheet or P&L that it is reported in. LedgerChange is the ledger change
+# counter: every commit, import or rebuild adds rows with the next version and
+# the months (YYYY-MM) that it changed. A NULL period is a change that is not
+# in the ledger, such as an import, and '*' means that every month changed.
+# Reports cache their figures by version and only redo the changed months.
+#
+
+ALTER TABLE Account ADD COLUMN section TEXT NOT NULL DEFAULT 'expense';
+
+UPDATE Account SET section = 'asset' WHERE name = 'Cash';
+UPDATE Account SET section = 'liability' WHERE name = 'TaxesCollected';
+UPDATE Account SET section = 'equity' WHERE name = 'OwnerCapital';
+UPDATE Account SET section = 'income' WHERE name IN ('Sales', 'ShippingCollected');
+
+CREATE TABLE LedgerChange
+        (version INTEGER NOT NULL,
+        period TEXT);
+
+CREATE INDEX LedgerChangeVersion ON LedgerChange (version);
+
+INSERT INTO LedgerChange (version, period) VALUES (1, '*');
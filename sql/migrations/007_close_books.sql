@@ -0,0 +1,39 @@
+###############################################################################
+#
+# Migration 7: Closing the books. A close freezes the ledger through its date
+# and keeps the balance of every account at the end of that date in
+# AccountSnapshot. Each snapshot is the one before it plus the legs between the
+# two dates, so work on the ledger after a close starts from the last snapshot.
+# The triggers keep legs on or before the last close date from being added,
+# changed or deleted, so the snapshots and the rollups of closed periods stay
+# valid.
+#
+
+CREATE TABLE BookClose
+        (ID INTEGER PRIMARY KEY AUTOINCREMENT,
+        date TEXT NOT NULL UNIQUE,  # YYYY-MM-DD, closed through the end of it
+        closed_at INTEGER NOT NULL);
+
+CREATE TABLE AccountSnapshot
+        (close_ID INTEGER NOT NULL REFERENCES BookClose(ID),
+        account_ID INTEGER NOT NULL,
+        balance REAL NOT NULL,
+        PRIMARY KEY (close_ID, account_ID)) WITHOUT ROWID;
+
+CREATE TRIGGER GenericTransactionClosedInsert BEFORE INSERT ON GenericTransaction
+    WHEN NEW.date <= (SELECT MAX(date) FROM BookClose)
+BEGIN
+    SELECT RAISE(ABORT, 'The books are closed for the date of the transaction');
+END;
+
+CREATE TRIGGER GenericTransactionClosedUpdate BEFORE UPDATE ON GenericTransaction
+    WHEN OLD.date <= (SELECT MAX(date) FROM BookClose) OR NEW.date <= (SELECT MAX(date) FROM BookClose)
+BEGIN
+    SELECT RAISE(ABORT, 'The books are closed for the date of the transaction');
+END;
+
+CREATE TRIGGER GenericTransactionClosedDelete BEFORE DELETE ON GenericTransaction
+    WHEN OLD.date <= (SELECT MAX(date) FROM BookClose)
+BEGIN
+    SELECT RAISE(ABORT, 'The books are closed for the date of the transaction');
+END;
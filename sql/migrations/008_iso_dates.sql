@@ -0,0 +1,26 @@
+###############################################################################
+#
+# Migration 8: Sortable dates for sales and purchases. The PayPal dates are
+# M/D/YYYY text, which does not sort or filter by date. iso_date is the same
+# date as YYYY-MM-DD, computed from date, so it is right for imported rows and
+# for dates edited in the forms. Dates that have no '/' are taken to be
+# YYYY-MM-DD already. The browsers sort and filter on it, using these indexes.
+# The indexes of migration 2 on the text are replaced.
+#
+
+DROP INDEX IF EXISTS SaleRecordDate;
+DROP INDEX IF EXISTS PurchaseRecordDate;
+
+ALTER TABLE SaleRecord ADD COLUMN iso_date TEXT GENERATED ALWAYS AS
+        (CASE WHEN instr(date, '/') = 0 THEN substr(date, 1, 10) ELSE
+            printf('%04d-%02d-%02d', substr(date, instr(date, '/') + instr(substr(date, instr(date, '/') + 1), '/') + 1),
+            substr(date, 1, instr(date, '/') - 1),
+            substr(date, instr(date, '/') + 1, instr(substr(date, instr(date, '/') + 1), '/') - 1)) END) VIRTUAL;
+CREATE INDEX SaleRecordIsoDate ON SaleRecord (iso_date);
+
+ALTER TABLE PurchaseRecord ADD COLUMN iso_date TEXT GENERATED ALWAYS AS
+        (CASE WHEN instr(date, '/') = 0 THEN substr(date, 1, 10) ELSE
+            printf('%04d-%02d-%02d', substr(date, instr(date, '/') + instr(substr(date, instr(date, '/') + 1), '/') + 1),
+            substr(date, 1, instr(date, '/') - 1),
+            substr(date, instr(date, '/') + 1, instr(substr(date, instr(date, '/') + 1), '/') - 1)) END) VIRTUAL;
+CREATE INDEX PurchaseRecordIsoDate ON PurchaseRecord (iso_date);
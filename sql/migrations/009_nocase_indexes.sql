@@ -0,0 +1,16 @@
+###############################################################################
+#
+# Migration 9: The browsers and the select dialog sort and match text without
+# regard to case. That uses COLLATE NOCASE, which can not use the BINARY indexes
+# of migrations 1 and 8. The BINARY indexes on the names are kept because the
+# importer looks names up with '='. The date indexes are only used by the
+# browsers, so they are replaced.
+#
+
+CREATE INDEX CustomerNameNocase ON Customer (name COLLATE NOCASE);
+CREATE INDEX VendorNameNocase ON Vendor (name COLLATE NOCASE);
+
+DROP INDEX IF EXISTS SaleRecordIsoDate;
+DROP INDEX IF EXISTS PurchaseRecordIsoDate;
+CREATE INDEX SaleRecordIsoDate ON SaleRecord (iso_date COLLATE NOCASE);
+CREATE INDEX PurchaseRecordIsoDate ON PurchaseRecord (iso_date COLLATE NOCASE);
@@ -0,0 +1,47 @@
+###############################################################################
+#
+# Migration 10: Protecting committed sales and purchases. Once a record is
+# committed its legs are in the ledger, so the values that were posted can not
+# be changed and the record can not be deleted, or the ledger would no longer
+# agree with it. Committing (committed false to true) is still allowed. When the
+# books are closed through the date of a committed record nothing in it can be
+# changed, like the legs of migration 7.
+#
+
+CREATE TRIGGER SaleRecordCommittedUpdate
+    BEFORE UPDATE OF date, gross, fees, shipping, committed ON SaleRecord
+    WHEN OLD.committed
+BEGIN
+    SELECT RAISE(ABORT, 'The sale is committed and the posted values can not be changed');
+END;
+
+CREATE TRIGGER SaleRecordClosedUpdate BEFORE UPDATE ON SaleRecord
+    WHEN OLD.committed AND OLD.iso_date <= (SELECT MAX(date) FROM BookClose)
+BEGIN
+    SELECT RAISE(ABORT, 'The books are closed for the date of the sale');
+END;
+
+CREATE TRIGGER SaleRecordCommittedDelete BEFORE DELETE ON SaleRecord
+    WHEN OLD.committed
+BEGIN
+    SELECT RAISE(ABORT, 'The sale is committed and can not be deleted');
+END;
+
+CREATE TRIGGER PurchaseRecordCommittedUpdate
+    BEFORE UPDATE OF date, type_ID, gross, tax, shipping, committed ON PurchaseRecord
+    WHEN OLD.committed
+BEGIN
+    SELECT RAISE(ABORT, 'The purchase is committed and the posted values can not be changed');
+END;
+
+CREATE TRIGGER PurchaseRecordClosedUpdate BEFORE UPDATE ON PurchaseRecord
+    WHEN OLD.committed AND OLD.iso_date <= (SELECT MAX(date) FROM BookClose)
+BEGIN
+    SELECT RAISE(ABORT, 'The books are closed for the date of the purchase');
+END;
+
+CREATE TRIGGER PurchaseRecordCommittedDelete BEFORE DELETE ON PurchaseRecord
+    WHEN OLD.committed
+BEGIN
+    SELECT RAISE(ABORT, 'The purchase is committed and can not be deleted');
+END;